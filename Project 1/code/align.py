@@ -6,13 +6,22 @@ are incorporated throughout. DO NOT modify the static types that are pre-defined
 explicitly mentioned. Changing expected behavior of functions will likely result in loss of points by the
 autograder.
 
-Usage: python align.py input_file output_file
+Usage: python align.py input_file output_file [--linear-space] [--max-alignments N] [--band W|auto] [--score-only]
+       [--cache FILE] [--profile [LOG]] [--storage object|array|bits] [--stream]
+       [--suboptimal N] [--fasta-a FILE [RECORD]] [--fasta-b FILE [RECORD]]
 """
 
+import argparse
+import contextlib
+import gzip
+import json
+import os
 import sys
-from typing import Set, Tuple, \
+import time
+from typing import Iterator, Set, Tuple, Union, \
     List  # NOTE: You may need to "pip install typing" locally if this import gives you errors
 import numpy as np
+from align_cache import AlignmentCache
 
 
 #### ------ USEFUL FUNCTIONS ------- ####
@@ -27,6 +36,86 @@ def fuzzy_equals(a: float, b: float) -> bool:
     return (abs(a - b) < epsilon)
 
 
+def encode_sequence(sequence: Union[str, bytes, bytearray], alphabet: str) -> np.ndarray:
+    """
+    Encode a sequence as the indices of its letters in an alphabet.
+    :param sequence: sequence to encode, a str or its latin-1 bytes (read in place, without a copy)
+    :param alphabet: letters of the alphabet, at most 256
+    :return: uint8 array of indices
+    """
+    if len(alphabet) > 256:
+        raise ValueError("Alphabets are limited to 256 letters, got {}".format(len(alphabet)))
+    letters = np.frombuffer(alphabet.encode('latin-1'), dtype=np.uint8)
+    lookup, known = np.zeros(256, dtype=np.uint8), np.zeros(256, dtype=bool)
+    lookup[letters], known[letters] = np.arange(len(alphabet)), True
+    raw = np.frombuffer(sequence.encode('latin-1') if isinstance(sequence, str) else sequence, dtype=np.uint8)
+    if not np.all(known[raw]):
+        unknown = sorted(set(bytes(raw).decode('latin-1')) - set(alphabet))
+        raise ValueError("Letters {} are not in the alphabet \"{}\"".format(", ".join(unknown), alphabet))
+    return lookup[raw]
+
+
+def open_sequence_file(path: str):
+    """
+    Open a sequence file for reading lines as bytes, decompressing it if it is gzipped
+    :param path: path to the file, gzipped or not
+    :return: binary file object
+    """
+    with open(path, 'rb') as f:
+        gzipped = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if gzipped else open(path, 'rb')
+
+
+def read_fasta(fasta_file: str, decode: bool = True) -> Iterator[Tuple[str, Union[str, bytearray]]]:
+    """
+    Read the records of a FASTA file, optionally gzipped, one at a time. The lines of a record are streamed into a
+    byte array, so that a record only takes one byte per letter while it is read.
+    :param fasta_file: path to the FASTA file
+    :param decode: decode the sequences to str, else hand out the byte arrays as they are
+    :return: generator of (name, sequence), the name being the header line without '>'
+    """
+    name, letters = None, bytearray()
+    with open_sequence_file(fasta_file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(b'>'):
+                if name is not None:
+                    yield name, letters.decode('latin-1') if decode else letters
+                name, letters = line[1:].strip().decode('latin-1'), bytearray()
+            elif line:
+                letters += line
+    if name is not None:
+        yield name, letters.decode('latin-1') if decode else letters
+
+
+def read_fasta_sequence(fasta_file: str, record: str = None, decode: bool = True) -> Union[str, bytearray]:
+    """
+    Read one sequence of a FASTA file, optionally gzipped, without keeping the other records
+    :param fasta_file: path to the FASTA file
+    :param record: name of the record, or the first word of it (the first record if None)
+    :param decode: decode the sequence to str, else return its byte array
+    :return: sequence
+    """
+    for name, sequence in read_fasta(fasta_file, decode):
+        if record is None or record in (name, name.split()[0] if name else name):
+            return sequence
+    raise ValueError("No record \"{}\" in \"{}\"".format(record, fasta_file))
+
+
+# direction flags of the packed pointer storage, one bit per matrix an entry can point to
+POINTER_FLAGS = {'M': 1, 'Ix': 2, 'Iy': 4}
+# offset (row, col) from an entry to the entries it points to, by the name of the matrix holding the entry
+POINTER_OFFSETS = {'M': (1, 1), 'Ix': (1, 0), 'Iy': (0, 1)}
+# matrices an entry can point to, by the name of the matrix holding the entry
+POINTER_SOURCES = {'M': ('M', 'Ix', 'Iy'), 'Ix': ('M', 'Ix'), 'Iy': ('M', 'Iy')}
+# buffer size of the streamed output file
+OUTPUT_BUFFER_SIZE = 1 << 20
+# matrix names by state index, as used by the linear space alignment
+MATRIX_NAMES = ('M', 'Ix', 'Iy')
+# largest sub-problem (in entries) the linear space alignment solves directly instead of dividing it further
+LINEAR_BLOCK_SIZE = 1 << 16
+
+
 #### ------- CLASSES ------- ####
 class MatchMatrix(object):
     """
@@ -65,8 +154,22 @@ class MatchMatrix(object):
         try:
             return self.data[(a, b)]
         except KeyError:
-            print("Key error for {}->{}".format(a, b))
-        pass
+            raise KeyError("No match score for {}->{}".format(a, b))
+
+    def to_table(self, alphabet_a: str, alphabet_b: str) -> np.ndarray:
+        """
+        Returns the scores as a dense table, where table[i, j] is the score of matching alphabet_a[i]
+        with alphabet_b[j].
+
+        :param alphabet_a: letters of the alphabet of sequence A
+        :param alphabet_b: letters of the alphabet of sequence B
+        :return: float64 array of shape (len(alphabet_a), len(alphabet_b))
+        """
+        missing = [(a, b) for a in alphabet_a for b in alphabet_b if (a, b) not in self.data]
+        if missing:
+            raise ValueError("No match score for {}".format(", ".join("{}->{}".format(a, b) for a, b in missing)))
+        return np.array([[self.data[(a, b)] for b in alphabet_b] for a in alphabet_a],
+                        dtype=np.float64).reshape(len(alphabet_a), len(alphabet_b))
 
 
 class ScoreMatrix(object):
@@ -74,19 +177,68 @@ class ScoreMatrix(object):
     A class representation of the score matrices (M, Ix, Iy), which will be dynamically updated.
     The score matrix consists of a 2-D array of ScoreEntries that are updated during alignment
     and used to output the maximum alignment.
+
+    Four storage modes are available:
+    - 'object': every entry is a ScoreEntry instance holding its score and a set of pointer tuples
+    - 'array': scores live in a contiguous float64 array and pointers in a uint8 array of direction flags
+      (see POINTER_FLAGS); only valid for matrices named M, Ix or Iy
+    - 'band': like 'array', but only the entries whose diagonal col - row lies in band = (low, high) are stored;
+      entries outside of the band score -inf and have no pointers
+    - 'bits': pointers are bit planes in np.packbits layout, one per matrix an entry can point to (see
+      POINTER_SOURCES), plus one marking the entries that score 0; scores are only kept where a traceback can
+      start (the last row and column), and the entries with the best score are marked in another bit plane.
+      Entries are written once, by the anti-diagonal fill.
     """
 
-    def __init__(self, name: str, nrow: int, ncol: int) -> None:
+    def __init__(self, name: str, nrow: int, ncol: int, storage: str = 'object',
+                 band: Tuple[int, int] = None) -> None:
         """
         Initialize ScoreMatrix class.
 
         :param name: identifier for the score matrix, should be in {Ix, Iy, M}
         :param nrow: number of rows for ScoreMatrix
         :param ncol: number of columns for ScoreMatrix
+        :param storage: storage mode, 'object', 'array', 'band' or 'bits'
+        :param band: (low, high) range of the diagonals col - row to store, for 'band' storage
         """
         self.name = name
         self.nrow = nrow
         self.ncol = ncol
+        self.storage = storage
+        self.band = band
+
+        if storage == 'bits':
+            if name not in POINTER_SOURCES:
+                raise ValueError("Packed storage needs a matrix named M, Ix or Iy, got \"{}\"".format(name))
+            width = (self.ncol + 7) // 8
+            self.pointer_bits = {source: np.zeros((self.nrow, width), dtype=np.uint8)
+                                 for source in POINTER_SOURCES[name]}
+            self.zero_bits = np.zeros((self.nrow, width), dtype=np.uint8)
+            self.last_row, self.last_col = np.full(self.ncol, -np.inf), np.full(self.nrow, -np.inf)
+            # entries within 10^-6 of the best score so far, and the (first, last) rows marked since it was set
+            self.best_score = -np.inf
+            self.best_bits = np.zeros((self.nrow, width), dtype=np.uint8)
+            self.best_range = None
+            return
+        if storage in ('array', 'band'):
+            if name not in POINTER_OFFSETS:
+                raise ValueError("Packed storage needs a matrix named M, Ix or Iy, got \"{}\"".format(name))
+            if storage == 'array':
+                shape = (self.nrow, self.ncol)
+            elif band is None or band[0] > band[1]:
+                raise ValueError("Band storage needs a band (low, high), got {}".format(band))
+            else:
+                # one diagonal per column, plus a padding column on each side so that the neighbours of
+                # in-band entries can be read as -inf
+                shape = (self.nrow, band[1] - band[0] + 3)
+            # contiguous scores and packed pointers (one bit per matrix being pointed to)
+            self.scores = np.full(shape, -np.inf if storage == 'band' else 0, dtype=np.float64)
+            self.pointer_flags = np.zeros(shape, dtype=np.uint8)
+            # scores and pointer_flags are views of these once columns are added, see add_columns
+            self.score_buffer, self.flag_buffer = self.scores, self.pointer_flags
+            return
+        elif storage != 'object':
+            raise ValueError("Unknown storage \"{}\", should be in {{object, array, band, bits}}".format(storage))
 
         class ScoreEntry(object):
             '''
@@ -114,6 +266,24 @@ class ScoreMatrix(object):
             print("Score matrix dimension [{},{}], but requested position [{},{}]".format(self.nrow, self.ncol, row, col))
             return False
 
+    def in_band(self, row: int, col: int) -> bool:
+        """
+        Whether an entry is stored, always True except for entries outside of the band of 'band' storage
+        :param row: row index
+        :param col: column index
+        """
+        return self.storage != 'band' or self.band[0] <= col - row <= self.band[1]
+
+    def __storedColumn__(self, row, col):
+        """
+        Column of the scores and pointer_flags arrays that holds an entry (or entries, for index arrays)
+        :param row: row index
+        :param col: column index
+        """
+        if self.storage == 'band':
+            return col - row - self.band[0] + 1
+        return col
+
     def get_score(self, row: int, col: int) -> float:
         """
         Return the current score for an entry in ScoreMatrix.
@@ -123,12 +293,98 @@ class ScoreMatrix(object):
         :return: current score at position (row, col)
         """
         if self.__checkIndex__(row, col):
+            if not self.in_band(row, col):
+                return -np.inf
+            if self.storage == 'bits':
+                return self.get_scores(np.array([row]), np.array([col]))[0]
+            if self.storage != 'object':
+                return self.scores[row, self.__storedColumn__(row, col)]
             entry = self.score_matrix[row, col]
             return entry.score
         else:
             return 0
         pass
 
+    def get_scores(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Return the current scores for many entries at once, -inf for entries outside of the band.
+
+        :param rows: row indices
+        :param cols: column indices
+        :return: scores at positions (rows, cols)
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        if self.storage == 'bits':
+            if np.any((rows != self.nrow - 1) & (cols != self.ncol - 1)):
+                raise ValueError("Bits storage only keeps the scores of the last row and column")
+            return np.where(rows == self.nrow - 1, self.last_row[cols], self.last_col[rows])
+        if self.storage == 'object':
+            return np.array([self.score_matrix[row, col].score for row, col in zip(rows, cols)], dtype=np.float64)
+        scores = np.full(rows.shape, -np.inf)
+        inside = np.ones(rows.shape, dtype=bool)
+        if self.storage == 'band':
+            inside = (self.band[0] <= cols - rows) & (cols - rows <= self.band[1])
+        scores[inside] = self.scores[rows[inside], self.__storedColumn__(rows[inside], cols[inside])]
+        return scores
+
+    def max_score(self) -> float:
+        """
+        Return the best score over all entries.
+        """
+        if self.storage == 'bits':
+            return float(self.best_score)
+        return float(np.max(self.__storedScores__()))
+
+    def find_scores(self, score: float, epsilon: float = 10 ** (-6)) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the entries whose score is within epsilon of a score.
+
+        :param score: score to look for
+        :param epsilon: tolerance, as in fuzzy_equals
+        :return: (rows, cols) of the matching entries
+        """
+        if self.storage == 'bits':
+            if abs(score - self.best_score) >= epsilon:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+            # only unpack the bytes with marks
+            byte_rows, byte_cols = np.nonzero(self.best_bits)
+            index, bits = np.nonzero(np.unpackbits(self.best_bits[byte_rows, byte_cols][:, None], axis=1))
+            return byte_rows[index], byte_cols[index] * 8 + bits
+        rows, stored_cols = np.nonzero(np.abs(self.__storedScores__() - score) < epsilon)
+        if self.storage == 'band':
+            return rows, stored_cols + rows + self.band[0] - 1
+        return rows, stored_cols
+
+    def entry_count(self) -> int:
+        """
+        Return the number of entries of the matrix, only counting the band for 'band' storage.
+        """
+        if self.storage != 'band':
+            return self.nrow * self.ncol
+        rows = np.arange(self.nrow)
+        first, last = np.maximum(rows + self.band[0], 0), np.minimum(rows + self.band[1], self.ncol - 1)
+        return int(np.sum(np.maximum(last - first + 1, 0)))
+
+    def memory_bytes(self) -> int:
+        """
+        Return the memory held by the matrix, approximate for 'object' storage.
+        """
+        if self.storage == 'bits':
+            return sum(array.nbytes for array in list(self.pointer_bits.values()) +
+                       [self.zero_bits, self.best_bits, self.last_row, self.last_col])
+        if self.storage != 'object':
+            return self.scores.nbytes + self.pointer_flags.nbytes
+        return self.score_matrix.nbytes + sum(sys.getsizeof(entry) + sys.getsizeof(entry.__dict__) +
+                                              sys.getsizeof(entry.pointer) for entry in self.score_matrix.flat)
+
+    def __storedScores__(self) -> np.ndarray:
+        """
+        Scores in their stored layout (see __storedColumn__), entries outside of the matrix or band being -inf
+        """
+        if self.storage == 'object':
+            return np.frompyfunc(lambda entry: entry.score, 1, 1)(self.score_matrix).astype(np.float64)
+        return self.scores
+
     def set_score(self, row: int, col: int, score: float) -> None:
         """
         Set the score for an entry in ScoreMatrix.
@@ -138,7 +394,14 @@ class ScoreMatrix(object):
         :param score: score to set at position (row, col)
         """
         if self.__checkIndex__(row, col):
-            self.score_matrix[row, col].score = round(score, 3)
+            if not self.in_band(row, col):
+                raise ValueError("Entry ({},{}) is outside of the band {}".format(row, col, self.band))
+            if self.storage == 'bits':
+                self.set_entries(np.array([row]), np.array([col]), np.array([round(score, 3)]), np.zeros(1, np.uint8))
+            elif self.storage != 'object':
+                self.scores[row, self.__storedColumn__(row, col)] = round(score, 3)
+            else:
+                self.score_matrix[row, col].score = round(score, 3)
         pass
 
     def get_pointers(self, row: int, col: int) -> Set[Tuple[int, int, str]]:
@@ -152,6 +415,15 @@ class ScoreMatrix(object):
         """
 
         if self.__checkIndex__(row, col):
+            if not self.in_band(row, col):
+                return set()
+            if self.storage == 'bits':
+                mask = 0x80 >> (col & 7)
+                flags = sum(POINTER_FLAGS[source] for source, plane in self.pointer_bits.items()
+                            if plane[row, col >> 3] & mask)
+                return self.__decodePointers__(row, col, flags)
+            if self.storage != 'object':
+                return self.__decodePointers__(row, col, self.pointer_flags[row, self.__storedColumn__(row, col)])
             entry = self.score_matrix[row, col]
             return entry.pointer
         pass
@@ -166,9 +438,129 @@ class ScoreMatrix(object):
         """
 
         if self.__checkIndex__(row, col):
-            self.score_matrix[row, col].pointer.update(pointers)
+            if not self.in_band(row, col):
+                raise ValueError("Entry ({},{}) is outside of the band {}".format(row, col, self.band))
+            if self.storage == 'bits':
+                flags = self.__encodePointers__(row, col, pointers)
+                for source, plane in self.pointer_bits.items():
+                    if flags & POINTER_FLAGS[source]:
+                        plane[row, col >> 3] |= 0x80 >> (col & 7)
+            elif self.storage != 'object':
+                self.pointer_flags[row, self.__storedColumn__(row, col)] |= self.__encodePointers__(row, col, pointers)
+            else:
+                self.score_matrix[row, col].pointer.update(pointers)
         pass
 
+    def set_entries(self, rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, flags: np.ndarray) -> None:
+        """
+        Set the scores and direction flags of many entries at once, for packed storage.
+
+        :param rows: row indices
+        :param cols: column indices
+        :param scores: scores to set, already rounded
+        :param flags: direction flags to set
+        """
+        if self.storage == 'bits':
+            self.__setBits__(np.atleast_1d(rows), np.atleast_1d(cols), np.atleast_1d(scores), np.atleast_1d(flags))
+            return
+        stored_cols = self.__storedColumn__(rows, cols)
+        self.scores[rows, stored_cols] = scores
+        self.pointer_flags[rows, stored_cols] = flags
+
+    def add_columns(self, count: int) -> None:
+        """
+        Append columns of entries scoring 0 without pointers, for 'object' and 'array' storage. Array storage grows
+        into spare columns, doubling them when they run out, so that adding a column at a time stays cheap.
+        :param count: number of columns to add
+        """
+        if self.storage not in ('object', 'array'):
+            raise ValueError("Columns can't be added to {} storage".format(self.storage))
+        ncol = self.ncol + count
+        if self.storage == 'object':
+            self.score_matrix = np.hstack([self.score_matrix, ScoreMatrix(self.name, self.nrow, count).score_matrix])
+        else:
+            if ncol > self.score_buffer.shape[1]:
+                capacity = max(ncol, 2 * self.score_buffer.shape[1])
+                self.score_buffer = np.zeros((self.nrow, capacity), dtype=np.float64)
+                self.flag_buffer = np.zeros((self.nrow, capacity), dtype=np.uint8)
+                self.score_buffer[:, :self.ncol], self.flag_buffer[:, :self.ncol] = self.scores, self.pointer_flags
+            self.scores, self.pointer_flags = self.score_buffer[:, :ncol], self.flag_buffer[:, :ncol]
+        self.ncol = ncol
+
+    def __setBits__(self, rows: np.ndarray, cols: np.ndarray, scores: np.ndarray, flags: np.ndarray) -> None:
+        """
+        Set many entries of 'bits' storage, at most one per row
+        :param rows: row indices
+        :param cols: column indices
+        :param scores: scores to set, already rounded
+        :param flags: direction flags to set
+        """
+        epsilon = 10 ** (-6)
+        scores = np.broadcast_to(scores, rows.shape)
+        flags = np.broadcast_to(flags, rows.shape)
+        byte_cols, masks = cols >> 3, (0x80 >> (cols & 7)).astype(np.uint8)
+        for source, plane in self.pointer_bits.items():
+            chosen = (flags & POINTER_FLAGS[source]) != 0
+            plane[rows[chosen], byte_cols[chosen]] |= masks[chosen]
+        zero = np.abs(scores) < epsilon
+        self.zero_bits[rows[zero], byte_cols[zero]] |= masks[zero]
+        last = rows == self.nrow - 1
+        self.last_row[cols[last]] = scores[last]
+        last = cols == self.ncol - 1
+        self.last_col[rows[last]] = scores[last]
+        # mark the entries close to the best score; scores are rounded to 3 decimals, so the marked entries all have
+        # the best score, and a better score unmarks all of them
+        best = np.max(scores)
+        if best > self.best_score + epsilon:
+            if self.best_range is not None:
+                self.best_bits[self.best_range[0]:self.best_range[1] + 1] = 0
+            self.best_score, self.best_range = best, None
+        close = scores > self.best_score - epsilon
+        if np.any(close):
+            self.best_bits[rows[close], byte_cols[close]] |= masks[close]
+            first, last = int(rows[close].min()), int(rows[close].max())
+            if self.best_range is not None:
+                first, last = min(first, self.best_range[0]), max(last, self.best_range[1])
+            self.best_range = (first, last)
+
+    def is_zero(self, row: int, col: int) -> bool:
+        """
+        Whether the score of an entry is 0 (within 10^-6), where local tracebacks end
+        :param row: row index
+        :param col: column index
+        """
+        if self.storage == 'bits':
+            return bool(self.zero_bits[row, col >> 3] & (0x80 >> (col & 7)))
+        return fuzzy_equals(self.get_score(row, col), 0)
+
+    def __decodePointers__(self, row: int, col: int, flags: int) -> Set[Tuple[int, int, str]]:
+        """
+        Convert packed direction flags of an entry into its set of pointers
+        :param row: row index
+        :param col: column index
+        :param flags: direction flags stored for (row, col)
+        :return: a set of pointers (row, col, matrix_name)
+        """
+        d_row, d_col = POINTER_OFFSETS[self.name]
+        return {(row - d_row, col - d_col, name) for name, flag in POINTER_FLAGS.items() if flags & flag}
+
+    def __encodePointers__(self, row: int, col: int, pointers: Set[Tuple[int, int, str]]) -> int:
+        """
+        Convert a set of pointers of an entry into packed direction flags
+        :param row: row index
+        :param col: column index
+        :param pointers: set of pointers (row, col, matrix_name)
+        :return: direction flags
+        """
+        d_row, d_col = POINTER_OFFSETS[self.name]
+        flags = 0
+        for pointer in pointers:
+            if len(pointer) != 3 or pointer[2] not in POINTER_FLAGS or \
+                    (row - pointer[0], col - pointer[1]) != (d_row, d_col):
+                raise ValueError("Pointer {} can't be stored for {}({},{})".format(pointer, self.name, row, col))
+            flags |= POINTER_FLAGS[pointer[2]]
+        return flags
+
     def __formatTable__(self, data: np.array) -> str:
         """
         This function formats the table to make it nicely looked
@@ -201,10 +593,12 @@ class ScoreMatrix(object):
 
         :return: a string representation of the scores in the score matrix
         """
+        if self.storage == 'array':
+            return self.__formatTable__(self.scores)
         data = np.zeros((self.nrow, self.ncol))
         for j in range(self.ncol):
             for i in range(self.nrow):
-                score = self.score_matrix[i, j].score
+                score = self.get_score(i, j)
                 data[i, j] = str(score)
         return self.__formatTable__(data)
         pass
@@ -217,7 +611,7 @@ class ScoreMatrix(object):
         data = np.zeros((self.nrow, self.ncol)).astype(str)
         for j in range(self.ncol):
             for i in range(self.nrow):
-                pointer = self.score_matrix[i, j].pointer
+                pointer = self.get_pointers(i, j)
                 if pointer:
                     data[i, j] = str(pointer)
                 else:
@@ -251,39 +645,173 @@ class AlignmentParameters(object):
         self.len_alphabet_b = 0
         self.alphabet_b = ""
         self.match_matrix = MatchMatrix()
-
-    def load_params_from_file(self, input_file: str) -> None:
+        # set by encode(): dense match scores and the sequences as indices into their alphabets
+        self.score_table = None
+        self.codes_a = None
+        self.codes_b = None
+        # (sequence, codes) of the FASTA records read by the last load, by (path and record, size, modification
+        # time, alphabet), so that loading the same records again doesn't read them again
+        self.fasta_reads = {}
+
+    def load_params_from_file(self, input_file: str, fasta_a: Union[str, Tuple[str, str]] = None,
+                              fasta_b: Union[str, Tuple[str, str]] = None) -> None:
         """
-        Read the parameters from an input file and update the alignment parameters accordingly
+        Read the parameters from an input file and update the alignment parameters accordingly. The file is read
+        line by line, so that a long sequence line is the only copy of that sequence in memory.
 
         :param input_file: path to the alignment input file (whose structure is defined on the project page)
+        :param fasta_a: FASTA file (optionally gzipped) to read seq_a from instead of the first line of the input
+        file, which is then ignored; either a path, for its first record, or (path, record name)
+        :param fasta_b: same as fasta_a, for seq_b and the second line of the input file; the FASTA records are
+        encoded straight from the bytes read, and only read again if their file changed since the last load
         """
         # read file and dividing values
         try:
-            with open(input_file) as f:
-                content = f.read()
+            f = open(input_file)
         except FileNotFoundError:
             print("File name \"{}\" invalid.".format(input_file))
             return
-        lines = [line.split() for line in content.split('\n')]
-        self.seq_a = lines[0][0]
-        self.seq_b = lines[1][0]
-        self.global_alignment = not int(lines[2][0])
-        self.dx = float(lines[3][0])
-        self.ex = float(lines[3][1])
-        self.dy = float(lines[3][2])
-        self.ey = float(lines[3][3])
-        self.len_alphabet_a = int(lines[4][0])
-        self.alphabet_a = lines[5][0]
-        self.len_alphabet_b = int(lines[6][0])
-        self.alphabet_b = lines[7][0]
-        for line in lines[8:]:
+        with f:
+            self.seq_a = f.readline().strip()
+            self.seq_b = f.readline().strip()
+            lines = [line.split() for line in f]
+        self.global_alignment = not int(lines[0][0])
+        self.dx = float(lines[1][0])
+        self.ex = float(lines[1][1])
+        self.dy = float(lines[1][2])
+        self.ey = float(lines[1][3])
+        self.len_alphabet_a = int(lines[2][0])
+        self.alphabet_a = lines[3][0]
+        self.len_alphabet_b = int(lines[4][0])
+        self.alphabet_b = lines[5][0]
+        for line in lines[6:]:
             # except for empty line
             if line == [''] or line == []: continue
             # set score iteratively
             self.match_matrix.set_score(line[2], line[3], float(line[4]))
+        # a FASTA record is encoded from its bytes before they are decoded, and reused if its file didn't change
+        reads, self.fasta_reads = self.fasta_reads, {}
+        sequences, codes = [self.seq_a, self.seq_b], [None, None]
+        for index, (fasta, alphabet) in enumerate(zip([fasta_a, fasta_b], self.alphabets())):
+            if fasta is None:
+                continue
+            fasta = (fasta,) if isinstance(fasta, str) else tuple(fasta)
+            stat = os.stat(fasta[0])
+            key = (fasta, stat.st_size, stat.st_mtime_ns, alphabet)
+            if key not in reads:
+                letters = read_fasta_sequence(*fasta, decode=False)
+                encoded = encode_sequence(letters, alphabet)
+                reads[key] = (letters.decode('latin-1'), encoded)
+            self.fasta_reads[key] = reads[key]
+            sequences[index], codes[index] = reads[key]
+        self.seq_a, self.seq_b = sequences
+        self.encode(*codes)
         pass
 
+    def alphabets(self) -> Tuple[str, str]:
+        """
+        Alphabets of the encoded sequences: the loaded ones, or else the sorted letters of the match matrix
+        :return: (alphabet A, alphabet B)
+        """
+        alphabet_a = self.alphabet_a or ''.join(sorted({a for a, _ in self.match_matrix.data}))
+        alphabet_b = self.alphabet_b or ''.join(sorted({b for _, b in self.match_matrix.data}))
+        return alphabet_a, alphabet_b
+
+    def encode(self, codes_a: np.ndarray = None, codes_b: np.ndarray = None) -> None:
+        """
+        Build the dense match score table over alphabet_a x alphabet_b and encode seq_a and seq_b as uint8 indices
+        into their alphabets, so that score_table[codes_a[i], codes_b[j]] is the score of matching seq_a[i] with
+        seq_b[j]. Must be called again after changing the sequences or the match matrix by hand.
+        If no alphabet was loaded, the letters of the match matrix are used (see alphabets).
+        :param codes_a: codes of seq_a if already encoded, kept as they are
+        :param codes_b: codes of seq_b if already encoded, kept as they are
+        """
+        alphabet_a, alphabet_b = self.alphabets()
+        self.score_table = self.match_matrix.to_table(alphabet_a, alphabet_b)
+        self.codes_a = codes_a if codes_a is not None else encode_sequence(self.seq_a, alphabet_a)
+        self.codes_b = codes_b if codes_b is not None else encode_sequence(self.seq_b, alphabet_b)
+
+
+class AlignmentProfile(object):
+    """
+    Wall time of each phase of an Align.align call (load, fill, traceback_start, traceback, write), with the matrix
+    entries each phase went through and the memory of the score matrices it held, and the co-optimal paths written.
+    """
+
+    def __init__(self, input_file: str = None) -> None:
+        """
+        Initialize AlignmentProfile object.
+
+        :param input_file: alignment input file path
+        """
+        self.input_file = input_file
+        # seconds by phase, in the order they ran
+        self.phases = {}
+        # matrix entries gone through and peak bytes of score matrices held, by phase
+        self.phase_cells = {}
+        self.phase_bytes = {}
+        # entries filled and peak bytes over all phases, set when align() returns
+        self.cells = 0
+        self.paths = 0
+        self.matrix_bytes = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Time the block of a with statement as a phase
+        :param name: name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def add(self, name: str, cells: int, matrix_bytes: int = 0) -> None:
+        """
+        Count matrix entries gone through by a phase, and the bytes of score matrices it held
+        :param name: name of the phase
+        :param cells: number of entries to add to the phase
+        :param matrix_bytes: bytes held by the score matrices, the phase keeping the largest
+        """
+        self.phase_cells[name] = self.phase_cells.get(name, 0) + cells
+        self.phase_bytes[name] = max(self.phase_bytes.get(name, 0), matrix_bytes)
+
+    def to_dict(self) -> dict:
+        """
+        Profile as a dictionary, with the entries processed per second and peak matrix memory of each phase
+        """
+        phases = {}
+        for name, seconds in self.phases.items():
+            cells = self.phase_cells.get(name, 0)
+            phases[name] = {'seconds': seconds, 'cells': cells,
+                            'cells_per_second': cells / seconds if cells and seconds > 0 else None,
+                            'matrix_bytes': self.phase_bytes.get(name, 0)}
+        return {'input_file': self.input_file, 'cells': self.cells, 'paths': self.paths,
+                'matrix_bytes': self.matrix_bytes, 'total_seconds': sum(self.phases.values()), 'phases': phases}
+
+    def append_to(self, log_file: str) -> None:
+        """
+        Append the profile to a log file as a JSON line
+        :param log_file: path of the log file
+        """
+        with open(log_file, "a") as f:
+            f.write(json.dumps(self.to_dict()) + '\n')
+
+    def report(self) -> str:
+        """
+        Profile as a table, one line per phase
+        """
+        lines = ["{:<16}{:>12}{:>12}{:>16}{:>12}".format("phase", "seconds", "cells", "cells/s", "peak MB")]
+        for name, values in self.to_dict()['phases'].items():
+            rate = values['cells_per_second']
+            lines.append("{:<16}{:>12.4f}{:>12}{:>16}{:>12.1f}".format(
+                name, values['seconds'], values['cells'], "" if rate is None else "{:.3g}".format(rate),
+                values['matrix_bytes'] / 2 ** 20))
+        lines.append("{} entries filled, {} co-optimal paths, {:.1f} MB of score matrices at peak".format(
+            self.cells, self.paths, self.matrix_bytes / 2 ** 20))
+        return '\n'.join(lines)
+
 
 class Align(object):
     """
@@ -302,28 +830,84 @@ class Align(object):
 
     """
 
-    def __init__(self, input_file: str, output_file: str) -> None:
+    def __init__(self, input_file: str, output_file: str, storage: str = 'array',
+                 fasta_a: Union[str, Tuple[str, str]] = None, fasta_b: Union[str, Tuple[str, str]] = None) -> None:
         """
         Initialize Align object.
 
         :param input_file: alignment input file path
         :param output_file: file path to write the output alignment
+        :param storage: storage mode of the score matrices, 'array' (compact), 'bits' (traceback bits only) or
+                        'object'
+        :param fasta_a: FASTA file to read seq_a from, see AlignmentParameters.load_params_from_file
+        :param fasta_b: FASTA file to read seq_b from, see AlignmentParameters.load_params_from_file
         """
         self.input_file = input_file
         self.output_file = output_file
+        self.storage = storage
+        self.fasta_a, self.fasta_b = fasta_a, fasta_b
+        # half width of the band of diagonals to fill around the main diagonal, or None to fill everything
+        self.bandwidth = None
         self.align_params = AlignmentParameters()
         # loading parameters
-        self.align_params.load_params_from_file(input_file)
+        if input_file is not None:
+            self.align_params.load_params_from_file(input_file, fasta_a, fasta_b)
         # seq_a as rows, seq_b as cols, set matrices to appropriate dims
         self.nrow, self.ncol = len(self.align_params.seq_a) + 1, len(self.align_params.seq_b) + 1
+        # matrices are allocated when they are first used (the linear space mode never needs them)
+        self.m_matrix, self.ix_matrix, self.iy_matrix = None, None, None
+        # entries that local alignments can't go through, set by top_local_alignments
+        self.masked = None
+
+    @classmethod
+    def from_params(cls, align_params: AlignmentParameters, output_file: str = '', storage: str = 'array') -> 'Align':
+        """
+        Create an Align object from parameters already in memory instead of an input file.
+
+        :param align_params: alignment parameters, encoded (see AlignmentParameters.encode)
+        :param output_file: file path to write the output alignment
+        :param storage: storage mode of the score matrices, 'array' (compact), 'bits' (traceback bits only) or
+                        'object'
+        :return: Align object, whose align() uses align_params as they are
+        """
+        align = cls(None, output_file, storage)
+        align.align_params = align_params
+        align.nrow, align.ncol = len(align_params.seq_a) + 1, len(align_params.seq_b) + 1
+        return align
+
+    def __allocateMatrices__(self) -> None:
+        """
+        Allocate the score matrices with the dims of the loaded sequences (only the band if bandwidth is set)
+        """
+        storage, band = self.storage, None
+        if self.bandwidth is not None:
+            storage, band = 'band', self.__band__(self.bandwidth)
         # best score when A[i] matches with B[j]
-        self.m_matrix = ScoreMatrix('M', self.nrow, self.ncol)
+        self.m_matrix = ScoreMatrix('M', self.nrow, self.ncol, storage, band)
         # best score when A[i] matches with '_'
-        self.ix_matrix = ScoreMatrix('Ix', self.nrow, self.ncol)
+        self.ix_matrix = ScoreMatrix('Ix', self.nrow, self.ncol, storage, band)
         # best score when B[j] matches with '_'
-        self.iy_matrix = ScoreMatrix('Iy', self.nrow, self.ncol)
+        self.iy_matrix = ScoreMatrix('Iy', self.nrow, self.ncol, storage, band)
+
+    def __ensureMatrices__(self) -> None:
+        """
+        Allocate the score matrices if they haven't been yet, so that update_m, update_ix, update_iy and
+        find_traceback_start can be called before populate_score_matrices
+        """
+        if self.m_matrix is None:
+            self.__allocateMatrices__()
+
+    def __band__(self, bandwidth: int) -> Tuple[int, int]:
+        """
+        Diagonals col - row within bandwidth of the diagonal from (0, 0) to (nrow-1, ncol-1)
+        :param bandwidth: half width of the band
+        :return: (low, high) range of diagonals
+        """
+        length_diff = (self.ncol - 1) - (self.nrow - 1)
+        return min(0, length_diff) - bandwidth, max(0, length_diff) + bandwidth
 
-    def align(self, verbose=False):
+    def align(self, verbose=False, linear_space=False, max_alignments=None, band=None, score_only=False, cache=None,
+              profile=False, stream=False, suboptimal=None):
         """
         Main method for running the alignment.
 
@@ -331,33 +915,199 @@ class Align(object):
         intermediates/output if it's helpful for debugging. The essential minimal functionality that this
         method must have is to write the resulting alignments to the output file in the format specified in the
         project page
+
+        :param verbose: print the alignments
+        :param linear_space: find a single optimal alignment in O(n + m) memory instead of all of them
+        :param max_alignments: write at most this many co-optimal alignments (all of them if None)
+        :param band: only fill the diagonals within this half width of the main diagonal, or 'auto' to double the
+        width until the best score doesn't change (everything is filled if None); the band has its own storage, so
+        it can't be used with 'bits' storage
+        :param score_only: only write the best score, found in O(n + m) memory without pointers or traceback
+        :param cache: AlignmentCache to look the result up in before aligning, and to store it in after
+        :param profile: return the AlignmentProfile of the run, also appended as a JSON line to the file if a path
+        :param stream: write each alignment to the output file as soon as it is traced back instead of keeping them
+        all in alignment_result (which is then None); streamed results aren't stored in the cache, and the writes
+        are timed as part of the traceback phase
+        :param suboptimal: write the best alignment of each of this many top local alignments that don't go through
+        the same entries (see top_local_alignments), each with its own score, instead of the co-optimal alignments
+        :return: AlignmentProfile if profile is set, else None
         """
+        if band is not None and self.storage == 'bits':
+            raise ValueError("A band is stored as such, it can't be combined with bits storage")
 
-        # load the alignment parameters into the align_params object
-        self.align_params.load_params_from_file(self.input_file)
+        self.profile = AlignmentProfile(self.input_file)
 
-        # populate the score matrices based on the input parameters
-        self.populate_score_matrices()
+        def measure(name, cells=0):
+            # matrix memory takes a pass over object storage, so it is only measured when the profile is asked for
+            self.profile.add(name, cells, self.__matrixBytes__() if profile else 0)
 
-        # perform a traceback and write the output to an output file
-        score, start_points = self.find_traceback_start()
-        traces = []
-        for start_point in start_points:
-            traces += self.traceback(start_point)
+        # load the alignment parameters into the align_params object
+        with self.profile.phase('load'):
+            if self.input_file is not None:
+                self.align_params.load_params_from_file(self.input_file, self.fasta_a, self.fasta_b)
+            self.nrow, self.ncol = len(self.align_params.seq_a) + 1, len(self.align_params.seq_b) + 1
+
+            # a cached result needs no matrices at all
+            if cache is not None:
+                key = cache.key(self.align_params, linear_space=linear_space, max_alignments=max_alignments,
+                                band=band, score_only=score_only, suboptimal=suboptimal)
+                self.alignment_result = cache.get(key)
+        measure('load')
+        if cache is not None and self.alignment_result is not None:
+            if verbose: print(self.alignment_result)
+            with self.profile.phase('write'):
+                self.write_output()
+            measure('write')
+            return self.__finishProfile__(profile)
+
+        if suboptimal:
+            with self.profile.phase('fill'):
+                self.masked = None
+                self.populate_score_matrices()
+            measure('fill', self.m_matrix.entry_count())
+            with self.profile.phase('traceback'):
+                hits = self.top_local_alignments(suboptimal)
+            measure('traceback', sum(len(trace) for _, trace in hits))
+            with self.profile.phase('write'):
+                # one block per alignment, in the format of format_result, separated by a blank line
+                self.alignment_result = '\n'.join(self.format_result(score, [self.__printOutput__(trace)])
+                                                   for score, trace in hits)
+                if verbose: print(self.alignment_result)
+                if cache is not None:
+                    cache.put(key, self.alignment_result)
+                self.write_output()
+            measure('write')
+            self.profile.paths = len(hits)
+            return self.__finishProfile__(profile)
+        if score_only:
+            with self.profile.phase('fill'):
+                score, end = self.find_best_score()
+            measure('fill', self.nrow * self.ncol)
+            traces = []
+            if verbose: print("best score {} ends at {}".format(score, end))
+        elif linear_space:
+            with self.profile.phase('fill'):
+                score, trace = self.linear_space_alignment()
+            measure('fill', self.nrow * self.ncol)
+            traces = [trace]
+        else:
+            # populate the score matrices based on the input parameters
+            with self.profile.phase('fill'):
+                if band == 'auto':
+                    cells = self.populate_band_auto()
+                else:
+                    if band != self.bandwidth:
+                        self.bandwidth, self.m_matrix = band, None
+                    self.populate_score_matrices()
+                    cells = self.m_matrix.entry_count()
+            measure('fill', cells)
+
+            # perform a traceback and write the output to an output file
+            with self.profile.phase('traceback_start'):
+                score, start_points = self.find_traceback_start()
+            # the last row and column in global mode, every entry in local mode
+            measure('traceback_start', self.nrow + self.ncol - 1 if self.align_params.global_alignment
+                    else self.m_matrix.entry_count())
+            traces = self.__countSteps__(self.iter_tracebacks(start_points, max_alignments))
         # print the results
         # for trace in traces: print(self.visualizePaths(trace))
+        if stream:
+            self.alignment_result = None
+            with self.profile.phase('traceback'):
+                self.profile.paths = self.stream_output(score, traces, verbose)
+            measure('traceback')
+            return self.__finishProfile__(profile)
         # store the alignments
+        with self.profile.phase('traceback'):
+            alignments = [self.__printOutput__(trace) for trace in traces]
+        measure('traceback')
         if verbose:
-            for trace in traces: print(self.__printOutput__(trace), '\n')
-        score_content = str(round(score, 1)) + '\n\n'
-        self.alignment_result = score_content + '\n'.join(self.__printOutput__(trace) + '\n' for trace in traces)
+            for alignment in alignments: print(alignment, '\n')
+        with self.profile.phase('write'):
+            self.alignment_result = self.format_result(score, alignments)
+            if cache is not None:
+                cache.put(key, self.alignment_result)
+            self.write_output()
+        measure('write')
+        self.profile.paths = len(alignments)
+        return self.__finishProfile__(profile)
+
+    def __finishProfile__(self, profile):
+        """
+        Add the totals of the phases to the profile of the last align() call, and hand it out as requested
+        :param profile: profile argument of align()
+        :return: the profile if requested, else None
+        """
+        if not profile:
+            return None
+        # a cached result fills nothing
+        self.profile.cells = self.profile.phase_cells.get('fill', 0)
+        self.profile.matrix_bytes = max(self.profile.phase_bytes.values(), default=0)
+        if isinstance(profile, str):
+            self.profile.append_to(profile)
+        return self.profile
+
+    def __matrixBytes__(self) -> int:
+        """
+        Memory held by the score matrices that are allocated, see ScoreMatrix.memory_bytes
+        """
+        matrices = [self.m_matrix, self.ix_matrix, self.iy_matrix]
+        return sum(matrix.memory_bytes() for matrix in matrices if matrix is not None)
+
+    def __countSteps__(self, traces):
+        """
+        Pass traces through, counting their entries as the cells of the traceback phase of the profile
+        :param traces: iterable of traces
+        :return: generator of the same traces
+        """
+        for trace in traces:
+            self.profile.add('traceback', len(trace))
+            yield trace
+
+    def write_alignments(self, max_alignments: int = None, verbose: bool = False) -> None:
+        """
+        Trace back the populated score matrices as they are and write the result to the output file, without
+        loading the input file again (e.g. after extend_b)
+        :param max_alignments: write at most this many co-optimal alignments (all of them if None)
+        :param verbose: print the alignments
+        """
+        if self.m_matrix is None:
+            raise ValueError("The score matrices aren't populated, see populate_score_matrices")
+        score, start_points = self.find_traceback_start()
+        alignments = [self.__printOutput__(trace) for trace in self.iter_tracebacks(start_points, max_alignments)]
+        if verbose:
+            for alignment in alignments: print(alignment, '\n')
+        self.alignment_result = self.format_result(score, alignments)
         self.write_output()
 
+    def format_result(self, score: float, alignments: List[str]) -> str:
+        """
+        Format a score and its alignments as in the output file
+        :param score: best score
+        :param alignments: alignments from __printOutput__
+        :return: output file content
+        """
+        # a best score of 0 is written as 0, as when the entries held the integer 0 they were initialized with
+        score_content = (str(round(score, 1)) if not fuzzy_equals(score, 0) else '0') + '\n\n'
+        return score_content + '\n'.join(alignment + '\n' for alignment in alignments)
+
     def populate_score_matrices(self) -> None:
         """
         Populate the score matrices based on the data in align_params. Should call update(i,j) for each entry
-        in the score matrices.
+        in the score matrices. Matrices with array, band or bits storage are filled by the equivalent anti-diagonal
+        wavefront instead.
         """
+        # allocated again when the sequences changed since, e.g. when align() reloads them after extend_b
+        if self.m_matrix is None or (self.m_matrix.nrow, self.m_matrix.ncol) != (self.nrow, self.ncol):
+            self.__allocateMatrices__()
+        if self.masked is not None and self.masked.shape != (self.nrow, self.ncol):
+            self.masked = None
+        # for other entries, update accordingly
+        # (packed matrices are filled a whole anti-diagonal at a time, border included)
+        matrices = [self.m_matrix, self.ix_matrix, self.iy_matrix]
+        if all(matrix.storage in ('array', 'band', 'bits') for matrix in matrices):
+            self.__fillWavefront__()
+            return
         # for initial entries, no end gap, set as 0
         for row in range(self.nrow):
             self.m_matrix.set_score(row, 0, 0)
@@ -367,12 +1117,204 @@ class Align(object):
             self.m_matrix.set_score(0, col, 0)
             self.ix_matrix.set_score(0, col, 0)
             self.iy_matrix.set_score(0, col, 0)
-        # for other entries, update accordingly
         for row in range(1, self.nrow):
             for col in range(1, self.ncol):
                 self.update(row, col)
         pass
 
+    def extend_b(self, suffix: str) -> None:
+        """
+        Append letters to seq_b. If the score matrices are populated, only the new columns are computed, from the
+        last stored column, after which find_traceback_start and traceback work on the extended alignment, and
+        write_alignments writes it (align() would load the sequences from the input file again).
+
+        :param suffix: letters to append to seq_b
+        """
+        if self.m_matrix is not None and self.m_matrix.storage not in ('object', 'array'):
+            raise ValueError("Only object and array matrices can be extended, not {}".format(self.m_matrix.storage))
+        first_col = self.ncol
+        self.align_params.seq_b += suffix
+        if self.align_params.codes_a is not None:
+            self.align_params.encode(self.align_params.codes_a)
+        self.ncol += len(suffix)
+        if self.m_matrix is None:
+            return
+        for matrix in [self.m_matrix, self.ix_matrix, self.iy_matrix]:
+            matrix.add_columns(len(suffix))
+        if self.masked is not None:
+            self.masked = np.hstack([self.masked, np.zeros((self.nrow, len(suffix)), dtype=bool)])
+        if self.m_matrix.storage == 'object':
+            for col in range(first_col, self.ncol):
+                self.m_matrix.set_score(0, col, 0)
+                self.ix_matrix.set_score(0, col, 0)
+                self.iy_matrix.set_score(0, col, 0)
+                for row in range(1, self.nrow):
+                    self.update(row, col)
+            return
+        for col in range(first_col, self.ncol):
+            self.__fillColumn__(col)
+
+    def __fillColumn__(self, col: int, first_row: int = 1) -> Union[int, None]:
+        """
+        Fill a column of the array matrices from the previous one, with the arithmetic, rounding and tie-aware
+        pointers of update_m, update_ix and update_iy. M and Iy only depend on the previous column, Ix is unrolled
+        down the column into a running max, as Iy along the row in __linearForward__.
+        Masked entries (see top_local_alignments) score 0 without pointers.
+        :param col: index of the column, at least 1
+        :param first_row: first row to fill, at least 1, the rows above it are kept as they are
+        :return: first row whose score or pointers changed, None if none did
+        """
+        epsilon = 10 ** (-6)
+        local = not self.align_params.global_alignment
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        table, codes_a, codes_b = self.__matchTable__()
+        matrices = [self.m_matrix, self.ix_matrix, self.iy_matrix]
+        # the column from first_row and the entries they depend on, read as slices of the array storage
+        m_scores, ix_scores, iy_scores = [matrix.scores for matrix in matrices]
+        length = self.nrow - first_row
+        masked = self.masked[first_row:, col] if self.masked is not None else None
+
+        def finish(score):
+            # rounded, with negative values set to 0 for local alignment, and masked entries set to 0
+            score = np.where(score < 0, 0, np.round(score, 3)) if local else np.round(score, 3)
+            return score if masked is None else np.where(masked, 0, score)
+
+        # M: from (row-1, col-1) in any matrix
+        score_ij = table[codes_a[first_row - 1:self.nrow - 1], codes_b[col - 1]]
+        m_values = [scores[first_row - 1:self.nrow - 1, col - 1] + score_ij
+                    for scores in [m_scores, ix_scores, iy_scores]]
+        m_score, m_flags = self.__maxWithFlags__(m_values, [POINTER_FLAGS['M'], POINTER_FLAGS['Ix'],
+                                                            POINTER_FLAGS['Iy']], epsilon)
+        # M and Ix of the column, from the row above the first one
+        m_column = np.concatenate([[m_scores[first_row - 1, col]], finish(m_score)])
+        # Iy: from (row, col-1) in M or Iy
+        iy_values = [m_scores[first_row:, col - 1] - dx, iy_scores[first_row:, col - 1] - ex]
+        iy_score, iy_flags = self.__maxWithFlags__(iy_values, [POINTER_FLAGS['M'], POINTER_FLAGS['Iy']], epsilon)
+        # Ix: from (row-1, col) in M or Ix, unrolled down the column into a running max over
+        # M(k) - dy - ey * (i-1-k), started again from the entry above the first row and from each masked entry
+        ix_column = np.zeros(length + 1)
+        ix_column[0] = ix_scores[first_row - 1, col]
+        steps = ey * np.arange(length + 1)
+        opened = m_column[:-1] - dy + steps[1:]
+        restarts = (np.nonzero(masked)[0] + 1).tolist() if masked is not None else []
+        bounds = [0] + restarts + [length + 1]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            running = np.maximum.accumulate(np.concatenate([[ix_column[start] + steps[start]], opened[start:stop - 1]]))
+            ix_column[start + 1:stop] = running[1:] - steps[start + 1:stop]
+        ix_column[1:] = finish(ix_column[1:])
+        ix_score, ix_flags = self.__maxWithFlags__([m_column[:-1] - dy, ix_column[:-1] - ey],
+                                                   [POINTER_FLAGS['M'], POINTER_FLAGS['Ix']], epsilon)
+        changed = np.zeros(length, dtype=bool)
+        for matrix, score, flags in zip(matrices, [m_score, ix_score, iy_score], [m_flags, ix_flags, iy_flags]):
+            score, flags = finish(score), flags if masked is None else np.where(masked, 0, flags)
+            changed |= (matrix.scores[first_row:, col] != score) | (matrix.pointer_flags[first_row:, col] != flags)
+            matrix.scores[first_row:, col], matrix.pointer_flags[first_row:, col] = score, flags
+        return first_row + int(np.argmax(changed)) if np.any(changed) else None
+
+    def __matchTable__(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Encoded sequences and dense match scores of align_params, encoding them if it wasn't done yet
+        :return: (table, codes_a, codes_b), where table[codes_a[i], codes_b[j]] = M(seq_a[i], seq_b[j])
+        """
+        if self.align_params.codes_a is None:
+            self.align_params.encode()
+        return self.align_params.score_table, self.align_params.codes_a, self.align_params.codes_b
+
+    def populate_band_auto(self, bandwidth: int = 16) -> int:
+        """
+        Populate banded score matrices, doubling the bandwidth until the best score is the same for two
+        bandwidths in a row (or the band covers the whole matrices).
+
+        :param bandwidth: half width of the first band
+        :return: number of entries filled, over all the bands
+        """
+        previous_score, cells = None, 0
+        while True:
+            self.bandwidth, self.m_matrix = bandwidth, None
+            self.populate_score_matrices()
+            cells += self.m_matrix.entry_count()
+            score, _ = self.find_traceback_start()
+            low, high = self.__band__(bandwidth)
+            if (previous_score is not None and fuzzy_equals(score, previous_score)) or \
+                    (low <= -(self.nrow - 1) and high >= self.ncol - 1):
+                return cells
+            previous_score, bandwidth = score, 2 * bandwidth
+
+    def __fillWavefront__(self) -> None:
+        """
+        Fill the packed M, Ix and Iy matrices anti-diagonal by anti-diagonal. Every entry of diagonal d = row + col
+        only depends on diagonals d-1 (Ix, Iy) and d-2 (M), so a whole diagonal is updated with array operations.
+        The arithmetic, rounding and tie-aware pointers are the same as in update_m, update_ix and update_iy.
+        With band storage only the entries inside the band are computed, the others count as -inf.
+        """
+        epsilon = 10 ** (-6)
+        local = not self.align_params.global_alignment
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        table, codes_a, codes_b = self.__matchTable__()
+        matrices = [self.m_matrix, self.ix_matrix, self.iy_matrix]
+        n, m = self.nrow - 1, self.ncol - 1
+        low, high = self.m_matrix.band if self.m_matrix.storage == 'band' else (-n, m)
+        # diagonal buffers indexed by row, entry r of diagonal d holds the score at (r, d - r),
+        # or -inf if (r, d - r) is outside of the matrices or the band
+        prev2 = np.full((3, self.nrow), -np.inf)  # M, Ix, Iy on diagonal d - 2
+        prev1 = np.full((3, self.nrow), -np.inf)  # M, Ix, Iy on diagonal d - 1
+        current = np.full((3, self.nrow), -np.inf)  # M, Ix, Iy on diagonal d, reused from diagonal d - 3
+        prev2_rows = prev1_rows = current_rows = (0, -1)
+        for d in range(n + m + 1):
+            # rows of the entries of this diagonal inside the matrices and the band
+            first, last = max(0, d - m, -((high - d) // 2)), min(n, d, (d - low) // 2)
+            current[:, current_rows[0]:current_rows[1] + 1] = -np.inf
+            # border entries score 0
+            for row in {0, d}:
+                if first <= row <= last:
+                    current[:, row] = 0
+                    for matrix in matrices:
+                        matrix.set_entries(row, d - row, 0, 0)
+            rows = np.arange(max(1, first), min(d - 1, last) + 1)
+            if len(rows):
+                cols = d - rows
+                above, left = rows - 1, rows
+                with np.errstate(invalid='ignore'):
+                    # M: from (row-1, col-1) in any matrix
+                    score_ij = table[codes_a[rows - 1], codes_b[cols - 1]]
+                    m_values = [prev2[0][above] + score_ij, prev2[1][above] + score_ij, prev2[2][above] + score_ij]
+                    m_score, m_flags = self.__maxWithFlags__(m_values, [POINTER_FLAGS['M'], POINTER_FLAGS['Ix'],
+                                                                        POINTER_FLAGS['Iy']], epsilon)
+                    # Ix: from (row-1, col) in M or Ix
+                    ix_values = [prev1[0][above] - dy, prev1[1][above] - ey]
+                    ix_score, ix_flags = self.__maxWithFlags__(ix_values, [POINTER_FLAGS['M'], POINTER_FLAGS['Ix']],
+                                                               epsilon)
+                    # Iy: from (row, col-1) in M or Iy
+                    iy_values = [prev1[0][left] - dx, prev1[2][left] - ex]
+                    iy_score, iy_flags = self.__maxWithFlags__(iy_values, [POINTER_FLAGS['M'], POINTER_FLAGS['Iy']],
+                                                               epsilon)
+                # store, with negative values set to 0 for local alignment
+                for buffer, matrix, score, flags in zip(current, matrices, [m_score, ix_score, iy_score],
+                                                        [m_flags, ix_flags, iy_flags]):
+                    score = np.where(score < 0, 0, np.round(score, 3)) if local else np.round(score, 3)
+                    buffer[rows] = score
+                    matrix.set_entries(rows, cols, score, flags)
+            prev2, prev1, current = prev1, current, prev2
+            prev2_rows, prev1_rows, current_rows = prev1_rows, (first, last), prev2_rows
+
+    def __maxWithFlags__(self, values: List[np.ndarray], flags: List[int], epsilon: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Element-wise version of __getMax__ over candidate arrays
+        :param values: candidate score arrays
+        :param flags: direction flag of each candidate
+        :param epsilon: tolerance for ties
+        :return: (max_values, direction flags of all candidates tying with the max)
+        """
+        max_values = values[0]
+        for value in values[1:]:
+            max_values = np.maximum(max_values, value)
+        max_flags = np.zeros(len(max_values), dtype=np.uint8)
+        for value, flag in zip(values, flags):
+            max_flags[np.abs(max_values - value) < epsilon] |= flag
+        return max_values, max_flags
+
     def update(self, row: int, col: int) -> None:
         """
         Update all matrices at a given row and column index.
@@ -407,7 +1349,7 @@ class Align(object):
         :param row: row index
         :param col: column index
         """
-
+        self.__ensureMatrices__()
         # get s(i, j) from match matrix
         letter_a, letter_b = self.align_params.seq_a[row - 1], self.align_params.seq_b[col - 1]
         score_ij = self.align_params.match_matrix.get_score(letter_a, letter_b)
@@ -436,7 +1378,7 @@ class Align(object):
         :param row: row index
         :param col: column index
         """
-
+        self.__ensureMatrices__()
         # choices from which we choose the maximum
         pre_pos = (row - 1, col)
         values = [self.m_matrix.get_score(pre_pos[0], pre_pos[1]) - self.align_params.dy,
@@ -461,7 +1403,7 @@ class Align(object):
         :param row: row index
         :param col: column index
         """
-
+        self.__ensureMatrices__()
         # choices from which we choose the maximum
         pre_pos = (row, col - 1)
         values = [self.m_matrix.get_score(pre_pos[0], pre_pos[1]) - self.align_params.dx,
@@ -490,35 +1432,73 @@ class Align(object):
         [ex. (5.5, {(1,2), (3,4)}) ].
         """
 
+        epsilon = 10 ** (-6)
+        self.__ensureMatrices__()
+        matrices = [self.m_matrix, self.ix_matrix, self.iy_matrix]
+        result = set()
         # if global alignment (no end gap penalty)
         if self.align_params.global_alignment:
             # search in the last row/col in matrices
-            # last row + last col
-            values = [self.m_matrix.get_score(self.nrow - 1, j) for j in range(self.ncol)] + \
-                     [self.ix_matrix.get_score(self.nrow - 1, j) for j in range(self.ncol)] + \
-                     [self.iy_matrix.get_score(self.nrow - 1, j) for j in range(self.ncol)] + \
-                     [self.m_matrix.get_score(i, self.ncol - 1) for i in range(self.nrow)] + \
-                     [self.ix_matrix.get_score(i, self.ncol - 1) for i in range(self.nrow)] + \
-                     [self.iy_matrix.get_score(i, self.ncol - 1) for i in range(self.nrow)]
-            coords = [(self.nrow - 1, j, self.m_matrix.name) for j in range(self.ncol)] + \
-                     [(self.nrow - 1, j, self.ix_matrix.name) for j in range(self.ncol)] + \
-                     [(self.nrow - 1, j, self.iy_matrix.name) for j in range(self.ncol)] + \
-                     [(i, self.ncol - 1, self.m_matrix.name) for i in range(self.nrow)] + \
-                     [(i, self.ncol - 1, self.ix_matrix.name) for i in range(self.nrow)] + \
-                     [(i, self.ncol - 1, self.iy_matrix.name) for i in range(self.nrow)]
-            result = self.__getMax__(values, coords)
+            rows = np.concatenate([np.full(self.ncol, self.nrow - 1), np.arange(self.nrow)])
+            cols = np.concatenate([np.arange(self.ncol), np.full(self.nrow, self.ncol - 1)])
+            values = [matrix.get_scores(rows, cols) for matrix in matrices]
+            max_value = max(float(np.max(value)) for value in values)
+            for matrix, value in zip(matrices, values):
+                matches = np.nonzero(np.abs(value - max_value) < epsilon)[0]
+                result.update((int(rows[k]), int(cols[k]), matrix.name) for k in matches)
         # if local alignment
         else:
             # search in the whole matrices
-            values = []
-            coords = []
-            for matrix in [self.m_matrix, self.ix_matrix, self.iy_matrix]:
-                for col in range(self.ncol):
-                    for row in range(self.nrow):
-                        values.append(matrix.get_score(row, col))
-                        coords.append((row, col, matrix.name))
-            result = self.__getMax__(values, coords)
-        return result
+            max_value = max(matrix.max_score() for matrix in matrices)
+            for matrix in matrices:
+                rows, cols = matrix.find_scores(max_value, epsilon)
+                result.update((row, col, matrix.name) for row, col in zip(rows.tolist(), cols.tolist()))
+        return max_value, result
+
+    def find_best_score(self) -> Tuple[float, Tuple[int, int, str]]:
+        """
+        Find the best score and where it ends without allocating the score matrices or any pointers. Only the last
+        three anti-diagonals of M, Ix and Iy are kept, and they are updated with the same arithmetic and rounding
+        as populate_score_matrices().
+
+        :return: (best score, (row, col, matrix name) of the first entry with the best score)
+        """
+        local = not self.align_params.global_alignment
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        table, codes_a, codes_b = self.__matchTable__()
+        n, m = self.nrow - 1, self.ncol - 1
+        # M, Ix, Iy on diagonals d - 2, d - 1 and d, indexed by row; every entry read below was written on its
+        # own diagonal, so stale entries left by older diagonals are never used
+        prev2, prev1, current = np.zeros((3, self.nrow)), np.zeros((3, self.nrow)), np.zeros((3, self.nrow))
+        best_score, best_end = -np.inf, None
+        for d in range(n + m + 1):
+            first, last = max(0, d - m), min(n, d)
+            # border entries score 0 (the ends of the diagonal that aren't on the border are overwritten below)
+            current[:, [first, last]] = 0
+            rows = np.arange(max(1, first), min(d - 1, last) + 1)
+            if len(rows):
+                cols = d - rows
+                score_ij = table[codes_a[rows - 1], codes_b[cols - 1]]
+                scores = [np.maximum(np.maximum(prev2[0][rows - 1], prev2[1][rows - 1]), prev2[2][rows - 1])
+                          + score_ij,
+                          np.maximum(prev1[0][rows - 1] - dy, prev1[1][rows - 1] - ey),
+                          np.maximum(prev1[0][rows] - dx, prev1[2][rows] - ex)]
+                for buffer, score in zip(current, scores):
+                    buffer[rows] = np.where(score < 0, 0, np.round(score, 3)) if local else np.round(score, 3)
+            # candidates for the end: anywhere for local alignment, else the last row and column
+            if local:
+                candidate_rows = np.arange(first, last + 1)
+            else:
+                candidate_rows = np.array(sorted(row for row in {n, d - m} if first <= row <= last), dtype=int)
+            if len(candidate_rows):
+                values = current[:, candidate_rows]
+                state, index = np.unravel_index(np.argmax(values), values.shape)
+                if values[state, index] > best_score:
+                    row = int(candidate_rows[index])
+                    best_score, best_end = values[state, index], (row, d - row, MATRIX_NAMES[state])
+            prev2, prev1, current = prev1, current, prev2
+        return float(best_score), best_end
 
     def __findMatrix__(self, name: str) -> ScoreMatrix:
         '''
@@ -529,35 +1509,6 @@ class Align(object):
         matrix_dict = {matrix.name: matrix for matrix in [self.m_matrix, self.ix_matrix, self.iy_matrix]}
         return matrix_dict[name]
 
-    def __tracebackRecursive__(self, position: Tuple[int, int, str],
-                               traces: List[List[Tuple[int, int, str]]]) -> List[List[Tuple[int, int, str]]]:
-        '''
-        Recursively traceback, records all possible paths
-        :param position: current position
-        :param traces: recorded paths tracked
-        :return: all recorded paths
-        '''
-
-        row, col, name = position
-        # if end of matrix, return
-        if row == 0 or col == 0:
-            return traces
-        # if not global and score is zero, return without the current one
-        elif (not self.align_params.global_alignment) and fuzzy_equals(self.__findMatrix__(name).get_score(row,col),0):
-            return [trace[:-1] for trace in traces]
-        else:
-            # find pointers
-            matrix = self.__findMatrix__(name)
-            pointers = matrix.get_pointers(row, col)
-            results = []
-            for pointer in pointers:
-                # add new point in traces
-                new_traces = [trace + [pointer] for trace in traces]
-                # Run recursive operation!
-                pointer_results = self.__tracebackRecursive__(pointer, new_traces)
-                results += pointer_results
-            return results
-
     def visualizePaths(self, path: List[Tuple[int, int, str]]) -> str:
         '''
         Visualize a path of traceback
@@ -575,22 +1526,6 @@ class Align(object):
 
         return '{}({},{})'.format(position[2], position[0], position[1])
 
-    def __deleteDuplicatePaths__(self, traces: List[List[Tuple[int, int, str]]]) -> List[List[Tuple[int, int, str]]]:
-        '''
-        Drop duplicate paths (regardless of the last border position's difference)
-        :param traces: list of paths
-        :return: list of paths containing unique paths
-        '''
-        traces_wo_tail = [tuple(trace[:-1]) for trace in traces]
-        trace_set = set()
-        unique_index = []
-        for i in range(len(traces_wo_tail)):
-            trace = traces_wo_tail[i]
-            if trace not in trace_set:
-                unique_index.append(i)
-                trace_set.update([trace])
-        return [traces[i] for i in unique_index]
-
     def traceback(self, start_point: Tuple[int, int, str]) -> List[List[Tuple[int, int, str]]]:
         """
         Perform a traceback.
@@ -601,9 +1536,338 @@ class Align(object):
         HINT: It is extremely helpful for debugging to include a way to print the traceback path.
            ex. M(5,4)->Iy(4,3)->M(4,2)->Ix(3,1)->Ix(2,1)->M(1,1)->M(0,0)
         """
-        traces = self.__tracebackRecursive__(position=start_point, traces=[[start_point]])
-        unique_traces = self.__deleteDuplicatePaths__(traces)
-        return unique_traces
+        return list(self.__iterTraces__(start_point))
+
+    def iter_tracebacks(self, start_points: Set[Tuple[int, int, str]], max_alignments: int = None):
+        """
+        Lazily enumerate the unique traces from a set of start points, one at a time.
+
+        :param start_points: positions to start the traceback from, as returned by find_traceback_start
+        :param max_alignments: stop after this many traces (all of them if None)
+        :return: generator of traces, each running from its start point back to the start of the alignment
+        """
+        count = 0
+        for start_point in sorted(start_points):
+            for trace in self.__iterTraces__(start_point):
+                if max_alignments is not None and count >= max_alignments:
+                    return
+                count += 1
+                yield trace
+
+    def __iterTraces__(self, start_point: Tuple[int, int, str]):
+        '''
+        Depth-first traceback with an explicit stack, yields every unique path once
+        :param start_point: position to start the traceback from
+        :return: generator of paths
+        '''
+        local = not self.align_params.global_alignment
+        row, col, name = start_point
+        # if end of matrix, or if not global and score is zero, the path is over
+        if row == 0 or col == 0:
+            yield [start_point]
+            return
+        if local and self.__findMatrix__(name).is_zero(row, col):
+            yield []
+            return
+        path = [start_point]
+        # for every entry of the path: pointers still to visit, and whether the path already ended there
+        stack = [[iter(sorted(self.__findMatrix__(name).get_pointers(row, col))), False]]
+        while stack:
+            pointer = next(stack[-1][0], None)
+            if pointer is None:
+                stack.pop()
+                path.pop()
+                continue
+            row, col, name = pointer
+            # paths ending at the border (kept in the path) or at a zero score (dropped for local alignment)
+            # only differ in their tail, so only the first one is kept
+            border = row == 0 or col == 0
+            if border or (local and self.__findMatrix__(name).is_zero(row, col)):
+                if not stack[-1][1]:
+                    stack[-1][1] = True
+                    yield path + [pointer] if border else list(path)
+                continue
+            path.append(pointer)
+            stack.append([iter(sorted(self.__findMatrix__(name).get_pointers(row, col))), False])
+
+    def top_local_alignments(self, count: int) -> List[Tuple[float, List[Tuple[int, int, str]]]]:
+        """
+        Find the best local alignments that don't go through the same entries (Waterman-Eggert). After each
+        alignment is found, its entries are masked (scoring 0 without pointers) and only the columns downstream of
+        them are filled again, from its first row and until a column comes out unchanged.
+
+        :param count: largest number of alignments to find
+        :return: (score, trace) of each alignment, from best to worst, stopping early when no score is positive
+        """
+        if self.align_params.global_alignment:
+            raise ValueError("Suboptimal alignments are only found in local mode")
+        if self.m_matrix is None or (self.m_matrix.nrow, self.m_matrix.ncol) != (self.nrow, self.ncol):
+            self.populate_score_matrices()
+        if self.m_matrix.storage != 'array':
+            raise ValueError("Suboptimal alignments need array storage, not {}".format(self.m_matrix.storage))
+        if self.masked is None:
+            self.masked = np.zeros((self.nrow, self.ncol), dtype=bool)
+        alignments = []
+        for _ in range(count):
+            score, start_points = self.find_traceback_start()
+            if score <= 0:
+                break
+            trace = next(self.iter_tracebacks(start_points, 1))
+            alignments.append((score, trace))
+            entries = [(row, col) for row, col, _ in trace if row > 0 and col > 0]
+            rows, cols = np.array(entries).T
+            self.masked[rows, cols] = True
+            # entries left of the first column of the alignment don't depend on it, and the rows of a column that can
+            # change start at the first row changed in the previous column or masked in this one
+            first_masked = {}
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                first_masked[col] = min(row, first_masked.get(col, row))
+            first_col, last_col, changed_row = int(cols.min()), int(cols.max()), None
+            for col in range(first_col, self.ncol):
+                starts = [row for row in [changed_row, first_masked.get(col)] if row is not None]
+                if not starts and col > last_col:
+                    break
+                changed_row = self.__fillColumn__(col, min(starts)) if starts else None
+        return alignments
+
+    def linear_space_alignment(self) -> Tuple[float, List[Tuple[int, int, str]]]:
+        """
+        Find one optimal alignment in O(n + m) memory, without allocating the score matrices.
+
+        A first pass over the rows keeps only the current row of M, Ix and Iy and finds the best score, where its
+        path ends and where that path starts. The path in between is then recovered by divide and conquer
+        (Myers-Miller): the best entry crossing the middle row is found from a forward pass from the start and a
+        backward pass from the end, and both halves are solved recursively.
+
+        :return: (best score, trace), where the trace runs from the end of the alignment to its start like the
+        traces returned by traceback()
+        """
+        if not self.align_params.global_alignment and (self.align_params.ex < 0 or self.align_params.ey < 0):
+            raise ValueError("Linear space local alignment needs non-negative gap extension penalties")
+        match = self.__matchTable__()
+        score, start, end = self.__linearForward__(match)
+        path = []
+        self.__linearPath__(start, end, match, path)
+        if not self.align_params.global_alignment:
+            # like traceback(), a local alignment starts after the last entry where its score drops to 0
+            running = np.cumsum(self.__pathSteps__(start, path, match))
+            zeros = np.nonzero(running < 10 ** (-6))[0]
+            if len(zeros):
+                path = path[zeros[-1] + 1:]
+        return score, [(row, col, MATRIX_NAMES[state]) for row, col, state in reversed(path)]
+
+    def __pathSteps__(self, start: Tuple[int, int, int], path: List[Tuple[int, int, int]],
+                      match: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+        """
+        Score added by each entry of a path
+        :param start: (row, col, state index) where the path begins
+        :param path: entries of the path after start, in order
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :return: array with the score of each step
+        """
+        table, codes_a, codes_b = match
+        gap_costs = {(0, 1): self.align_params.dy, (1, 1): self.align_params.ey,
+                     (0, 2): self.align_params.dx, (2, 2): self.align_params.ex}
+        steps = np.zeros(len(path))
+        prev_state = start[2]
+        for index, (row, col, state) in enumerate(path):
+            if state == 0:
+                steps[index] = table[codes_a[row - 1], codes_b[col - 1]]
+            else:
+                steps[index] = -gap_costs[(prev_state, state)]
+            prev_state = state
+        return steps
+
+    def __linearForward__(self, match: Tuple[np.ndarray, np.ndarray, np.ndarray]) \
+            -> Tuple[float, Tuple[int, int, int], Tuple[int, int, int]]:
+        """
+        Score the alignment row by row, carrying for every entry the entry its best path starts from
+        (a border entry, or for local alignment an entry whose score was set to 0)
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :return: (best score, start, end), where start and end are (row, col, state index)
+        """
+        table, codes_a, codes_b = match
+        local = not self.align_params.global_alignment
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        nrow, ncol = self.nrow, self.ncol
+        cols = np.arange(ncol)
+        inner = np.arange(ncol - 1)
+        states = np.arange(3)[:, None]
+        # scores of the current row and the entry each best path starts from, encoded as (row*ncol + col)*3 + state
+        scores = np.zeros((3, ncol))
+        origins = cols[None, :] * 3 + states
+        best_score, best_end, best_origin = -np.inf, None, None
+        for row in range(nrow):
+            if row > 0:
+                prev_scores, prev_origins = scores, origins
+                own = (row * ncol + cols[None, :]) * 3 + states
+                scores, origins = np.zeros((3, ncol)), own.copy()
+                # M: from (row-1, col-1) in any matrix
+                values = prev_scores[:, :-1] + table[codes_a[row - 1], codes_b]
+                choice = np.argmax(values, axis=0)
+                scores[0, 1:] = values[choice, inner]
+                origins[0, 1:] = prev_origins[choice, inner]
+                # Ix: from (row-1, col) in M or Ix
+                values = np.array([prev_scores[0, 1:] - dy, prev_scores[1, 1:] - ey])
+                choice = np.argmax(values, axis=0)
+                scores[1, 1:] = values[choice, inner]
+                origins[1, 1:] = prev_origins[choice, inner + 1]
+                if local:
+                    restart = scores[:2] < 0
+                    scores[:2][restart], origins[:2][restart] = 0, own[:2][restart]
+                # Iy: from (row, col-1) in M or Iy, unrolled along the row into a running max over
+                # M(row, k) - dx - ex * (col-1-k) and Iy(row, 0) - ex * col
+                values = np.concatenate([[0], scores[0, :-1] - dx + ex * (inner + 1)])
+                running = np.maximum.accumulate(values)
+                source = np.maximum.accumulate(np.where(values == running, cols, 0))
+                scores[2, 1:] = running[1:] - ex * cols[1:]
+                origins[2, 1:] = np.where(source == 0, own[2, 0], origins[0, source - 1])[1:]
+                if local:
+                    restart = scores[2] < 0
+                    scores[2, restart], origins[2, restart] = 0, own[2, restart]
+            # candidates for the end: anywhere for local alignment, else the last row and column
+            if local or row == nrow - 1:
+                state, col = np.unravel_index(np.argmax(scores), scores.shape)
+            else:
+                state, col = np.argmax(scores[:, -1]), ncol - 1
+            if scores[state, col] > best_score:
+                best_score, best_end, best_origin = scores[state, col], (row, col, state), origins[state, col]
+        best_start = (int(best_origin // 3 // ncol), int(best_origin // 3 % ncol), int(best_origin % 3))
+        return float(best_score), best_start, (int(best_end[0]), int(best_end[1]), int(best_end[2]))
+
+    def __anchoredForward__(self, start: Tuple[int, int, int], last_row: int, last_col: int,
+                            match: Tuple[np.ndarray, np.ndarray, np.ndarray]):
+        """
+        Yield the rows of the best scores of paths beginning at start, without any restart or border entries
+        :param start: (row, col, state index) where every path begins, with score 0
+        :param last_row: last row to yield
+        :param last_col: last column of the sub-problem, rows span columns start[1]..last_col
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :return: generator of (row, scores), scores having shape (3, last_col - start[1] + 1)
+        """
+        table, codes_a, codes_b = match
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        first_row, first_col, first_state = start
+        width = last_col - first_col
+        steps = np.arange(width + 1)
+        # first row: the start entry, then Iy entries reached from it (border entries are never visited)
+        scores = np.full((3, width + 1), -np.inf)
+        scores[first_state, 0] = 0
+        if first_row > 0 and width > 0 and first_state != 1:
+            scores[2, 1:] = (-dx if first_state == 0 else -ex) - ex * (steps[1:] - 1)
+        yield first_row, scores
+        for row in range(first_row + 1, last_row + 1):
+            prev_scores = scores
+            scores = np.full((3, width + 1), -np.inf)
+            scores[0, 1:] = np.max(prev_scores[:, :-1], axis=0) + table[codes_a[row - 1], codes_b[first_col:last_col]]
+            scores[1] = np.maximum(prev_scores[0] - dy, prev_scores[1] - ey)
+            if first_col == 0:
+                scores[1, 0] = -np.inf
+            scores[2, 1:] = np.maximum.accumulate(scores[0, :-1] - dx + ex * (steps[:-1] + 1)) - ex * steps[1:]
+            yield row, scores
+
+    def __anchoredBackward__(self, end: Tuple[int, int, int], first_row: int, first_col: int,
+                             match: Tuple[np.ndarray, np.ndarray, np.ndarray]):
+        """
+        Yield, from the last row upwards, the best scores still to gain from an entry until reaching end
+        :param end: (row, col, state index) where every path ends
+        :param first_row: first row to yield
+        :param first_col: first column of the sub-problem, rows span columns first_col..end[1]
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :return: generator of (row, scores), scores having shape (3, end[1] - first_col + 1)
+        """
+        table, codes_a, codes_b = match
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        last_row, last_col, last_state = end
+        width = last_col - first_col
+        steps = np.arange(width + 1)
+        # last row: the end entry, reached along the row through Iy
+        scores = np.full((3, width + 1), -np.inf)
+        scores[last_state, width] = 0
+        if last_state == 2 and width > 0:
+            scores[2, :-1] = -ex * (width - steps[:-1])
+            scores[0, :-1] = -dx - ex * (width - steps[:-1] - 1)
+        yield last_row, scores
+        for row in range(last_row - 1, first_row - 1, -1):
+            next_scores = scores
+            scores = np.full((3, width + 1), -np.inf)
+            # to M(row+1, col+1) from any matrix
+            diagonal = np.full(width + 1, -np.inf)
+            diagonal[:-1] = next_scores[0, 1:] + table[codes_a[row], codes_b[first_col:last_col]]
+            # to Ix(row+1, col) from M or Ix, never into the border column
+            down = next_scores[1].copy()
+            if first_col == 0:
+                down[0] = -np.inf
+            # to Iy(row, col+1) from M or Iy, unrolled along the row into a running max from the right
+            scores[2] = np.maximum.accumulate((diagonal - ex * steps)[::-1])[::-1] + ex * steps
+            scores[1] = np.maximum(diagonal, down - ey)
+            right = np.full(width + 1, -np.inf)
+            right[:-1] = scores[2, 1:] - dx
+            scores[0] = np.maximum(np.maximum(diagonal, down - dy), right)
+            yield row, scores
+
+    def __linearPath__(self, start: Tuple[int, int, int], end: Tuple[int, int, int],
+                       match: Tuple[np.ndarray, np.ndarray, np.ndarray], path: List[Tuple[int, int, int]]) -> None:
+        """
+        Append to path an optimal path from start (excluded) to end (included), by divide and conquer
+        :param start: (row, col, state index) where the path begins
+        :param end: (row, col, state index) where the path ends
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :param path: list to append the entries of the path to, in order
+        """
+        (first_row, first_col, _), (last_row, last_col, _) = start, end
+        if last_row - first_row <= 1 or (last_row - first_row + 1) * (last_col - first_col + 1) <= LINEAR_BLOCK_SIZE:
+            path += self.__blockPath__(start, end, match)
+            return
+        # best entry of the middle row on a path from start to end
+        middle_row = (first_row + last_row) // 2
+        for row, forward in self.__anchoredForward__(start, middle_row, last_col, match):
+            pass
+        for row, backward in self.__anchoredBackward__(end, middle_row, first_col, match):
+            pass
+        total = forward + backward
+        state, step = np.unravel_index(np.argmax(total), total.shape)
+        assert np.isfinite(total[state, step]), "no path from {} to {}".format(start, end)
+        middle = (middle_row, first_col + int(step), int(state))
+        self.__linearPath__(start, middle, match, path)
+        self.__linearPath__(middle, end, match, path)
+
+    def __blockPath__(self, start: Tuple[int, int, int], end: Tuple[int, int, int],
+                      match: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> List[Tuple[int, int, int]]:
+        """
+        Find an optimal path from start (excluded) to end (included) by keeping every row of a small sub-problem
+        :param start: (row, col, state index) where the path begins
+        :param end: (row, col, state index) where the path ends
+        :param match: (table, codes_a, codes_b) from __matchTable__
+        :return: entries of the path, in order
+        """
+        table, codes_a, codes_b = match
+        dx, ex = self.align_params.dx, self.align_params.ex
+        dy, ey = self.align_params.dy, self.align_params.ey
+        first_col = start[1]
+        rows = {row: scores for row, scores in self.__anchoredForward__(start, end[0], end[1], match)}
+        path = []
+        row, col, state = end
+        while (row, col, state) != start:
+            path.append((row, col, state))
+            step = col - first_col
+            if state == 0:
+                score_ij = table[codes_a[row - 1], codes_b[col - 1]]
+                candidates = [(row - 1, col - 1, prev, rows[row - 1][prev, step - 1] + score_ij) for prev in range(3)]
+            elif state == 1:
+                candidates = [(row - 1, col, 0, rows[row - 1][0, step] - dy),
+                              (row - 1, col, 1, rows[row - 1][1, step] - ey)]
+            else:
+                candidates = [(row, col - 1, 0, rows[row][0, step - 1] - dx),
+                              (row, col - 1, 2, rows[row][2, step - 1] - ex)]
+            # the predecessor whose score accounts for this one
+            score = rows[row][state, step]
+            row, col, state, _ = min(candidates, key=lambda candidate: abs(candidate[3] - score))
+        path.reverse()
+        return path
 
     def __omitEndGap__(self, alignment_a: str, alignment_b: str) -> Tuple[str, str]:
         return self.__recursiveDelete__(alignment_a, alignment_b)
@@ -616,23 +1880,24 @@ class Align(object):
         else: return str_a, str_b
 
     def __printOutput__(self, trace: List[Tuple[int, int, str]]) -> str:
-        align_a, align_b = '', ''
+        # the trace runs from the end of the alignment to its start, so collect letters backwards
+        align_a, align_b = [], []
         for element in trace:
             row, col, name = element
             if row == 0 or col == 0: break
             # if m_matrix, matched
-            if name == self.m_matrix.name:
-                align_a = self.align_params.seq_a[row - 1] + align_a
-                align_b = self.align_params.seq_b[col - 1] + align_b
+            if name == 'M':
+                align_a.append(self.align_params.seq_a[row - 1])
+                align_b.append(self.align_params.seq_b[col - 1])
             # if ix_matrix, seq_a is matching with gap '_'
-            elif name == self.ix_matrix.name:
-                align_a = self.align_params.seq_a[row - 1] + align_a
-                align_b = '_' + align_b
+            elif name == 'Ix':
+                align_a.append(self.align_params.seq_a[row - 1])
+                align_b.append('_')
             # if iy_matrix, seq_b is matching with gap '_'
-            elif name == self.iy_matrix.name:
-                align_a = '_' + align_a
-                align_b = self.align_params.seq_b[col - 1] + align_b
-        return '\n'.join([align_a, align_b])
+            elif name == 'Iy':
+                align_a.append('_')
+                align_b.append(self.align_params.seq_b[col - 1])
+        return '\n'.join([''.join(reversed(align_a)), ''.join(reversed(align_b))])
 
     def write_output(self) -> None:
         """
@@ -648,25 +1913,90 @@ class Align(object):
         print('Saved to', self.output_file)
         return
 
+    def stream_output(self, score: float, traces, verbose: bool = False) -> int:
+        """
+        Write the output of an alignment to the output file while the traces are produced, in the format of
+        format_result, so that only one alignment is held in memory at a time.
+
+        :param score: best score
+        :param traces: iterable of traces, e.g. from iter_tracebacks
+        :param verbose: print the alignments
+        :return: number of alignments written
+        """
+        import os
+        if (self.output_file=='') or (not os.path.isdir(os.path.dirname(self.output_file))):
+            print('Didn\'t save file')
+            return 0
+        count = 0
+        with open(self.output_file, "w", buffering=OUTPUT_BUFFER_SIZE) as f:
+            f.write(self.format_result(score, []))
+            for trace in traces:
+                alignment = self.__printOutput__(trace)
+                if verbose: print(alignment, '\n')
+                # alignments are separated by a blank line, as in format_result
+                f.write(('\n' if count else '') + alignment + '\n')
+                count += 1
+        print('Saved to', self.output_file)
+        return count
+
 
-# DO NOT MODIFY THE CODE BELOW!
 def main():
     """
     Run the align function from command line, passing the input and output paths as arguments.
-    """
 
-    # Check that arguments are in present in the command line as expected
-    if (len(sys.argv) != 3):
-        print("Please specify an input file and an output file as args.")
-        return
-
-    # input variables
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    Usage: python align.py input_file output_file [--linear-space] [--max-alignments N] [--band W|auto] [--score-only]
+           [--cache FILE] [--profile [LOG]] [--storage object|array|bits] [--stream]
+           [--suboptimal N] [--fasta-a FILE [RECORD]] [--fasta-b FILE [RECORD]]
+    """
+    parser = argparse.ArgumentParser(description="Align the two sequences of an alignment input file.")
+    parser.add_argument("input_file", help="alignment input file path")
+    parser.add_argument("output_file", help="file path to write the output alignment")
+    parser.add_argument("--linear-space", action="store_true",
+                        help="output a single optimal alignment found in O(n + m) memory")
+    parser.add_argument("--max-alignments", type=int, default=None,
+                        help="output at most this many co-optimal alignments")
+    parser.add_argument("--band", type=lambda value: value if value == 'auto' else int(value), default=None,
+                        help="only fill the diagonals within this half width of the main diagonal, "
+                             "or 'auto' to double the width until the score is stable (not with --storage bits)")
+    parser.add_argument("--score-only", action="store_true",
+                        help="only output the best score, without pointers or traceback")
+    parser.add_argument("--cache", default=None, help="SQLite file caching the results across runs")
+    parser.add_argument("--profile", nargs="?", const=True, default=False, metavar="LOG",
+                        help="print the time spent in each phase, and append it as a JSON line to LOG if given")
+    parser.add_argument("--storage", choices=["object", "array", "bits"], default="array",
+                        help="storage of the score matrices, 'bits' only keeps the traceback pointers as bit planes")
+    parser.add_argument("--stream", action="store_true",
+                        help="write each alignment as soon as it is traced back instead of all of them at the end")
+    parser.add_argument("--suboptimal", type=int, default=None, metavar="N",
+                        help="write the N best local alignments that don't go through the same entries")
+    for name in ['a', 'b']:
+        parser.add_argument("--fasta-" + name, nargs="+", default=None, metavar=("FILE", "RECORD"),
+                            help="read sequence {} from a FASTA file (optionally gzipped), from its first record or "
+                                 "the named one".format(name.upper()))
+    args = parser.parse_args()
+    if args.band is not None and args.storage == 'bits':
+        parser.error("--band can't be combined with --storage bits")
+    for fasta in [args.fasta_a, args.fasta_b]:
+        if fasta is not None and len(fasta) > 2:
+            parser.error("--fasta-a and --fasta-b take a file and at most one record name")
+    if args.suboptimal is not None and args.band is not None:
+        parser.error("--suboptimal can't be combined with --band")
+    if args.suboptimal is not None and args.storage != 'array':
+        parser.error("--suboptimal needs --storage array")
 
     # create an align object and run
-    align = Align(input_file, output_file)
-    align.align()
+    cache = AlignmentCache(args.cache) if args.cache else None
+    align = Align(args.input_file, args.output_file, args.storage,
+                  tuple(args.fasta_a) if args.fasta_a else None, tuple(args.fasta_b) if args.fasta_b else None)
+    if args.suboptimal is not None and align.align_params.global_alignment:
+        parser.error("--suboptimal only finds local alignments, but {} is in global mode".format(args.input_file))
+    profile = align.align(linear_space=args.linear_space, max_alignments=args.max_alignments, band=args.band,
+                          score_only=args.score_only, cache=cache, profile=args.profile, stream=args.stream,
+                          suboptimal=args.suboptimal)
+    if cache is not None:
+        cache.close()
+    if profile is not None:
+        print(profile.report())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""
+Batch runner for align.py: aligns many input files in a pool of worker processes, so that the interpreter and
+NumPy start-up cost is paid once per worker instead of once per input file.
+
+Each output file is written by its worker as soon as the alignment finishes, and a timing summary is printed
+at the end.
+
+Usage: python align_batch.py inputs [inputs ...] output_dir [--workers N] [--linear-space] [--max-alignments N]
+       [--score-only]
+  where each of the inputs is a directory of *.input files, an alignment input file (*.input), or a manifest
+  listing one input file path per line.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Tuple, Union
+from align import Align
+
+
+def collect_inputs(paths: List[str]) -> List[str]:
+    """
+    Expand directories and manifests into the list of input files to align.
+
+    :param paths: directories of *.input files, input files (*.input) or manifests (one input path per line,
+        relative to the manifest, blank lines and lines starting with '#' ignored)
+    :return: list of input file paths, in order
+    """
+    input_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            input_files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.input'))
+        elif path.endswith('.input'):
+            input_files.append(path)
+        else:
+            with open(path) as f:
+                lines = [line.strip() for line in f]
+            input_files += [os.path.join(os.path.dirname(path), line) for line in lines
+                            if line and not line.startswith('#')]
+    return input_files
+
+
+def output_path(input_file: str, output_dir: str) -> str:
+    """
+    Path of the output file of an input file, e.g. output_dir/example.output for example.input
+    :param input_file: alignment input file path
+    :param output_dir: directory of the output files
+    :return: output file path
+    """
+    name = os.path.basename(input_file)
+    if name.endswith('.input'):
+        name = name[:-len('.input')]
+    return os.path.abspath(os.path.join(output_dir, name + '.output'))
+
+
+def align_job(input_file: str, output_file: str, options: dict) -> Tuple[str, str, float]:
+    """
+    Align one input file and write its output, in a worker process.
+    :param input_file: alignment input file path
+    :param output_file: file path to write the output alignment
+    :param options: keyword arguments of Align.align
+    :return: (input_file, output_file, seconds spent)
+    """
+    start = time.perf_counter()
+    Align(input_file, output_file).align(**options)
+    return input_file, output_file, time.perf_counter() - start
+
+
+def run_batch(input_files: List[str], output_dir: str, workers: int = None,
+              **options) -> List[Tuple[str, str, Union[float, None], Union[str, None]]]:
+    """
+    Align every input file across a pool of worker processes.
+
+    :param input_files: alignment input file paths
+    :param output_dir: directory to write the output files to, created if missing
+    :param workers: number of worker processes (number of CPUs if None)
+    :param options: keyword arguments passed to Align.align, e.g. linear_space, max_alignments or score_only
+    :return: one (input_file, output_file, seconds, error) per job, in order of completion;
+        seconds is None and error the message for jobs that failed
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = {pool.submit(align_job, input_file, output_path(input_file, output_dir), options): input_file
+                for input_file in input_files}
+        for job in as_completed(jobs):
+            input_file = jobs[job]
+            try:
+                _, output_file, seconds = job.result()
+                results.append((input_file, output_file, seconds, None))
+                print("Done   {:8.3f}s  {}".format(seconds, input_file))
+            except Exception as error:
+                results.append((input_file, output_path(input_file, output_dir), None, repr(error)))
+                print("Failed            {}: {!r}".format(input_file, error))
+    return results
+
+
+def print_summary(results: List[Tuple[str, str, Union[float, None], Union[str, None]]], wall_time: float) -> None:
+    """
+    Print the time spent on each job and the totals
+    :param results: results of run_batch
+    :param wall_time: seconds spent on the whole batch
+    """
+    times = [seconds for _, _, seconds, _ in results if seconds is not None]
+    print("\n{:>10}  {}".format("seconds", "input"))
+    for input_file, _, seconds, error in sorted(results):
+        print("{:>10}  {}".format("failed" if seconds is None else "{:.3f}".format(seconds), input_file))
+    print("\n{} jobs, {} failed".format(len(results), len(results) - len(times)))
+    if times:
+        print("job time: total {:.3f}s, mean {:.3f}s, max {:.3f}s".format(sum(times), sum(times) / len(times),
+                                                                        max(times)))
+    print("wall time: {:.3f}s".format(wall_time))
+
+
+def main():
+    """
+    Run a batch of alignments from command line.
+    """
+    parser = argparse.ArgumentParser(description="Align many alignment input files in parallel.")
+    parser.add_argument("inputs", nargs="+", help="directories of *.input files, input files or manifests")
+    parser.add_argument("output_dir", help="directory to write the output files to")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--linear-space", action="store_true",
+                        help="output a single optimal alignment found in O(n + m) memory")
+    parser.add_argument("--max-alignments", type=int, default=None,
+                        help="output at most this many co-optimal alignments")
+    parser.add_argument("--score-only", action="store_true",
+                        help="only output the best scores, without pointers or traceback")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(collect_inputs(args.inputs), args.output_dir, args.workers,
+                        linear_space=args.linear_space, max_alignments=args.max_alignments,
+                        score_only=args.score_only)
+    print_summary(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
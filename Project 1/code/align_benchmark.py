@@ -0,0 +1,252 @@
+"""
+Benchmark suite for align.py.
+
+Synthetic pairs of sequences, either unrelated (random) or one being a mutated copy of the other (mutated), are
+aligned in global and local mode at increasing lengths. Each phase of an alignment (load, fill, traceback start,
+traceback, write) is timed separately, and the peak memory of each case is measured in a second, traced run.
+Results are saved as JSON, and two result files can be compared against regression thresholds.
+
+Pairs whose full matrices would exceed --max-cells entries are aligned in linear space instead, in which case the
+fill phase covers the whole alignment and the traceback start is not timed.
+
+Usage: python align_benchmark.py run results.json [--lengths 100,1000,5000,20000] [--modes global,local]
+           [--kinds random,mutated] [--seed S] [--max-cells N] [--max-alignments N]
+       python align_benchmark.py compare baseline.json results.json [--time-threshold R] [--memory-threshold R]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List, Tuple
+import numpy as np
+from align import Align
+
+# parameters of the synthetic alignments: DNA, matches score 1, mismatches -1, gaps open at 2 and extend at 0.5
+ALPHABET = "ATGC"
+MATCH_SCORE, MISMATCH_SCORE = 1, -1
+GAP_PENALTIES = (2, 0.5, 2, 0.5)
+# substitution, deletion and insertion rates of the mutated copies
+MUTATION_RATES = (0.05, 0.02, 0.02)
+# phases of an alignment, in order
+PHASES = ('load', 'fill', 'traceback_start', 'traceback', 'write')
+# differences below these are noise, whatever the thresholds
+MIN_TIME_DIFFERENCE = 0.05
+MIN_MEMORY_DIFFERENCE = 1 << 20
+
+
+def generate_pair(length: int, kind: str, rng: random.Random) -> Tuple[str, str]:
+    """
+    Generate a pair of sequences
+    :param length: length of the first sequence
+    :param kind: 'random' for two unrelated sequences, 'mutated' for a sequence and a mutated copy of it
+    :param rng: random number generator
+    :return: (seq_a, seq_b)
+    """
+    seq_a = ''.join(rng.choice(ALPHABET) for _ in range(length))
+    if kind == 'random':
+        return seq_a, ''.join(rng.choice(ALPHABET) for _ in range(length))
+    if kind != 'mutated':
+        raise ValueError("Unknown kind \"{}\", should be in {{random, mutated}}".format(kind))
+    substitution, deletion, insertion = MUTATION_RATES
+    seq_b = []
+    for letter in seq_a:
+        draw = rng.random()
+        if draw < substitution:
+            seq_b.append(rng.choice(ALPHABET))
+        elif draw < substitution + deletion:
+            continue
+        elif draw < substitution + deletion + insertion:
+            seq_b += [letter, rng.choice(ALPHABET)]
+        else:
+            seq_b.append(letter)
+    return seq_a, ''.join(seq_b)
+
+
+def write_input(input_file: str, seq_a: str, seq_b: str, global_alignment: bool) -> None:
+    """
+    Write an alignment input file with the synthetic parameters
+    :param input_file: path of the input file
+    :param seq_a: first sequence
+    :param seq_b: second sequence
+    :param global_alignment: global (ends-free) alignment if True, else local
+    """
+    lines = [seq_a, seq_b, '0' if global_alignment else '1', ' '.join(str(gap) for gap in GAP_PENALTIES),
+             str(len(ALPHABET)), ALPHABET, str(len(ALPHABET)), ALPHABET]
+    for i, a in enumerate(ALPHABET):
+        for j, b in enumerate(ALPHABET):
+            lines.append("{} {} {} {} {}".format(i + 1, j + 1, a, b, MATCH_SCORE if a == b else MISMATCH_SCORE))
+    with open(input_file, "w") as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def run_phases(input_file: str, output_file: str, linear_space: bool, max_alignments: int) -> Tuple[dict, float]:
+    """
+    Align an input file with the profile of Align.align
+    :param input_file: alignment input file path
+    :param output_file: file path to write the output alignment
+    :param linear_space: align in linear space
+    :param max_alignments: number of co-optimal alignments to trace back
+    :return: (seconds spent by phase, None for phases that don't apply; best score, rounded as in the output)
+    """
+    start = time.perf_counter()
+    align = Align(input_file, output_file)
+    created = time.perf_counter() - start
+    phases = align.align(linear_space=linear_space, max_alignments=max_alignments, profile=True).to_dict()['phases']
+    times = {phase: phases[phase]['seconds'] if phase in phases else None for phase in PHASES}
+    # the input file is also read when the Align object is created
+    times['load'] += created
+    return times, float(align.alignment_result.split('\n')[0])
+
+
+def run_case(directory: str, length: int, global_alignment: bool, kind: str, rng: random.Random,
+             max_cells: int, max_alignments: int) -> dict:
+    """
+    Benchmark one synthetic alignment
+    :param directory: directory for the input and output files
+    :param length: length of the first sequence
+    :param global_alignment: global (ends-free) alignment if True, else local
+    :param kind: kind of pair, see generate_pair
+    :param rng: random number generator
+    :param max_cells: largest number of matrix entries to align with full matrices
+    :param max_alignments: number of co-optimal alignments to trace back
+    :return: case results
+    """
+    seq_a, seq_b = generate_pair(length, kind, rng)
+    name = "{}_{}_{}".format('global' if global_alignment else 'local', kind, length)
+    input_file = os.path.join(directory, name + '.input')
+    output_file = os.path.join(directory, name + '.output')
+    write_input(input_file, seq_a, seq_b, global_alignment)
+    cells = (len(seq_a) + 1) * (len(seq_b) + 1)
+    linear_space = cells > max_cells
+
+    # the align.py messages would only clutter the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        times, score = run_phases(input_file, output_file, linear_space, max_alignments)
+        tracemalloc.start()
+        run_phases(input_file, output_file, linear_space, max_alignments)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'name': name, 'length': length, 'mode': 'global' if global_alignment else 'local', 'kind': kind,
+            'engine': 'linear' if linear_space else 'full', 'cells': cells, 'score': round(score, 1),
+            'phases': times, 'total': sum(seconds for seconds in times.values() if seconds is not None),
+            'peak_bytes': peak}
+
+
+def run_suite(lengths: List[int], modes: List[str], kinds: List[str], seed: int = 0, max_cells: int = 10 ** 7,
+              max_alignments: int = 100) -> dict:
+    """
+    Benchmark every combination of length, mode and kind
+    :param lengths: lengths of the first sequences
+    :param modes: 'global' and/or 'local'
+    :param kinds: 'random' and/or 'mutated'
+    :param seed: seed of the sequence generator
+    :param max_cells: largest number of matrix entries to align with full matrices, larger pairs use linear space
+    :param max_alignments: number of co-optimal alignments to trace back
+    :return: results, with the environment and one entry per case
+    """
+    rng = random.Random(seed)
+    cases = []
+    with tempfile.TemporaryDirectory() as directory:
+        for length in lengths:
+            for mode in modes:
+                for kind in kinds:
+                    case = run_case(directory, length, mode == 'global', kind, rng, max_cells, max_alignments)
+                    print("{:<24} {:>8} {:8.3f}s {:10.1f} MB".format(case['name'], case['engine'], case['total'],
+                                                                    case['peak_bytes'] / 2 ** 20))
+                    cases.append(case)
+    return {'commit': git_commit(), 'python': platform.python_version(), 'numpy': np.__version__, 'seed': seed,
+            'cases': cases}
+
+
+def git_commit() -> str:
+    """
+    Commit of the working tree, None outside of a git repository
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: dict, results: dict, time_threshold: float = 1.25,
+            memory_threshold: float = 1.25) -> List[str]:
+    """
+    Find the regressions of results against a baseline, over the cases both have run
+    :param baseline: results of run_suite on the reference commit
+    :param results: results of run_suite to check
+    :param time_threshold: largest accepted ratio of time, by phase and in total
+    :param memory_threshold: largest accepted ratio of peak memory
+    :return: description of each regression
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = baseline_cases.get(case['name'])
+        if old is None or old['engine'] != case['engine']:
+            continue
+        timings = [(phase, old['phases'][phase], case['phases'][phase]) for phase in PHASES]
+        for label, before, after in timings + [('total', old['total'], case['total'])]:
+            if before is not None and after is not None and \
+                    after > before * time_threshold and after - before > MIN_TIME_DIFFERENCE:
+                regressions.append("{} {}: {:.3f}s -> {:.3f}s".format(case['name'], label, before, after))
+        if case['peak_bytes'] > old['peak_bytes'] * memory_threshold and \
+                case['peak_bytes'] - old['peak_bytes'] > MIN_MEMORY_DIFFERENCE:
+            regressions.append("{} peak memory: {:.1f} MB -> {:.1f} MB".format(
+                case['name'], old['peak_bytes'] / 2 ** 20, case['peak_bytes'] / 2 ** 20))
+        if case['score'] != old['score']:
+            regressions.append("{} score: {} -> {}".format(case['name'], old['score'], case['score']))
+    return regressions
+
+
+def main():
+    """
+    Run the benchmark suite or compare two result files from command line.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark align.py on synthetic sequence pairs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the benchmark suite")
+    run.add_argument("results", help="JSON file to save the results to")
+    run.add_argument("--lengths", default="100,1000,5000,20000", help="comma separated sequence lengths")
+    run.add_argument("--modes", default="global,local", help="comma separated modes, global and/or local")
+    run.add_argument("--kinds", default="random,mutated", help="comma separated kinds, random and/or mutated")
+    run.add_argument("--seed", type=int, default=0, help="seed of the sequence generator")
+    run.add_argument("--max-cells", type=int, default=10 ** 7,
+                     help="largest number of matrix entries to align with full matrices")
+    run.add_argument("--max-alignments", type=int, default=100, help="co-optimal alignments to trace back")
+    check = commands.add_parser("compare", help="compare results against a baseline")
+    check.add_argument("baseline", help="JSON results of the reference commit")
+    check.add_argument("results", help="JSON results to check")
+    check.add_argument("--time-threshold", type=float, default=1.25, help="largest accepted ratio of time")
+    check.add_argument("--memory-threshold", type=float, default=1.25, help="largest accepted ratio of peak memory")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite([int(length) for length in args.lengths.split(',')], args.modes.split(','),
+                            args.kinds.split(','), args.seed, args.max_cells, args.max_alignments)
+        with open(args.results, "w") as f:
+            json.dump(results, f, indent=2)
+        print('Saved to', args.results)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.results) as f:
+            results = json.load(f)
+        regressions = compare(baseline, results, args.time_threshold, args.memory_threshold)
+        for regression in regressions:
+            print(regression)
+        print("{} regressions".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
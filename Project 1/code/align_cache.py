@@ -0,0 +1,128 @@
+"""
+Cache of alignment results, keyed by the content of the alignment: both sequences, the mode, the gap penalties,
+the match matrix and the options of Align.align that change the output.
+
+Results are kept in an in-memory LRU tier and, optionally, an on-disk SQLite tier shared across runs. Both tiers
+are kept under a size limit in bytes by evicting the least recently used results.
+
+Usage (from python):
+    cache = AlignmentCache("alignments.sqlite")
+    Align(input_file, output_file).align(cache=cache)
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Union
+
+
+class AlignmentCache(object):
+    """
+    Two tier (memory, then SQLite) cache of alignment output files
+    """
+
+    def __init__(self, path: str = None, memory_bytes: int = 16 << 20, disk_bytes: int = 256 << 20) -> None:
+        """
+        Initialize AlignmentCache object.
+
+        :param path: SQLite database file of the disk tier, created if missing (no disk tier if None)
+        :param memory_bytes: total size of the results kept in memory
+        :param disk_bytes: total size of the results kept on disk
+        """
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # key -> (result, size in bytes), from least to most recently used
+        self.memory = OrderedDict()
+        self.memory_size = 0
+        self.hits, self.misses = 0, 0
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS results "
+                                    "(key TEXT PRIMARY KEY, result TEXT, size INTEGER, last_used REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            self.connection.commit()
+
+    @staticmethod
+    def key(align_params, **options) -> str:
+        """
+        Content address of an alignment
+        :param align_params: loaded AlignmentParameters
+        :param options: options of Align.align that change the output, e.g. max_alignments
+        :return: SHA-256 hex digest
+        """
+        content = {
+            'seq_a': align_params.seq_a,
+            'seq_b': align_params.seq_b,
+            'global': align_params.global_alignment,
+            'gaps': [align_params.dx, align_params.ex, align_params.dy, align_params.ey],
+            'match': sorted([a, b, score] for (a, b), score in align_params.match_matrix.data.items()),
+            'options': sorted(options.items()),
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Union[str, None]:
+        """
+        Look up a result, in memory first, then on disk
+        :param key: content address from key()
+        :return: cached output file content, None if missing
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key][0]
+        if self.connection is not None:
+            row = self.connection.execute("SELECT result, size FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.connection.commit()
+                self.__remember__(key, row[0], row[1])
+                self.hits += 1
+                return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: str) -> None:
+        """
+        Store a result in both tiers, evicting the least recently used results over the limits
+        :param key: content address from key()
+        :param result: output file content
+        """
+        size = len(result.encode())
+        self.__remember__(key, result, size)
+        if self.connection is None:
+            return
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, result, size, time.time()))
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        # only the least recently used rows are read, through the index on last_used
+        while total > self.disk_bytes:
+            old_key, old_size = self.connection.execute("SELECT key, size FROM results ORDER BY last_used "
+                                                        "LIMIT 1").fetchone()
+            self.connection.execute("DELETE FROM results WHERE key = ?", (old_key,))
+            total -= old_size
+        self.connection.commit()
+
+    def __remember__(self, key: str, result: str, size: int) -> None:
+        """
+        Store a result in memory, evicting the least recently used ones over the limit
+        :param key: content address from key()
+        :param result: output file content
+        :param size: size of the result in bytes
+        """
+        if key in self.memory:
+            self.memory_size -= self.memory.pop(key)[1]
+        self.memory[key] = (result, size)
+        self.memory_size += size
+        while self.memory_size > self.memory_bytes:
+            _, (_, old_size) = self.memory.popitem(last=False)
+            self.memory_size -= old_size
+
+    def close(self) -> None:
+        """
+        Close the disk tier
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,245 @@
+"""
+All-vs-all alignment scores and distances of a collection of sequences, for clustering.
+
+The sequences are copied once into shared memory, and the gap penalties and match matrix of an alignment input file
+are handed once to each worker of a process pool. The symmetric score matrix is split into square blocks along its
+upper triangle; each block is scored by a worker with the score-only pass of Align (no pointers nor traceback), and
+mirrored into the lower triangle. Pair (i, j) with i <= j is aligned with sequence i as A and sequence j as B.
+
+With a checkpoint file, the score matrix is kept in a NumPy file as blocks complete, and a later run with the same
+checkpoint only scores the blocks that are missing from it. The checkpoint is keyed by the content of the sequences,
+mode, gap penalties and match matrix (as align_cache keys alignments), in a .key file next to it, and a checkpoint
+whose key doesn't match is discarded.
+
+Usage: python align_distance.py input_file sequences output_file [--block-size N] [--workers N]
+       [--checkpoint FILE] [--scores]
+  where the mode, gap penalties and match matrix come from the alignment input file, sequences is a FASTA file
+  (optionally gzipped), and the output file is a tab separated matrix of distances (or of scores, with --scores).
+"""
+
+import argparse
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import List, Tuple
+import numpy as np
+from align import Align, AlignmentParameters, encode_sequence, read_fasta
+from align_cache import AlignmentCache
+
+# shared sequences and alignment parameters, set once in each worker process
+_shared = {}
+
+
+def block_pairs(count: int, block_size: int) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """
+    Blocks of the upper triangle of a count x count matrix, diagonal blocks included
+    :param count: number of sequences
+    :param block_size: number of rows and columns of a block
+    :return: ((row_start, row_stop), (col_start, col_stop)) of each block
+    """
+    ranges = [(start, min(start + block_size, count)) for start in range(0, count, block_size)]
+    return [(rows, cols) for index, rows in enumerate(ranges) for cols in ranges[index:]]
+
+
+def checkpoint_key(sequences: List[str], align_params: AlignmentParameters) -> str:
+    """
+    Content address of the scores of a set of sequences, see AlignmentCache.key
+    :param sequences: sequences, in order
+    :param align_params: loaded alignment parameters (their own sequences are ignored)
+    :return: SHA-256 hex digest
+    """
+    key_params = copy.copy(align_params)
+    key_params.seq_a, key_params.seq_b = '', ''
+    return AlignmentCache.key(key_params, sequences=list(sequences))
+
+
+def share_sequences(sequences: List[str]) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    """
+    Copy the letters of the sequences, one after the other, into a shared memory block
+    :param sequences: sequences to share
+    :return: (shared memory block, to be closed and unlinked by the caller; offsets of the sequences in it, the
+        letters of sequence i being at offsets[i]:offsets[i+1])
+    """
+    offsets = np.concatenate([[0], np.cumsum([len(sequence) for sequence in sequences])]).astype(np.int64)
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(offsets[-1])))
+    letters = np.ndarray(int(offsets[-1]), dtype=np.uint8, buffer=block.buf)
+    letters[:] = np.frombuffer(''.join(sequences).encode('latin-1'), dtype=np.uint8)
+    return block, offsets
+
+
+def attach_sequences(name: str, offsets: np.ndarray, align_params: AlignmentParameters) -> None:
+    """
+    Attach to the shared sequences and keep the alignment parameters (pool initializer)
+    :param name: name of the shared memory block from share_sequences
+    :param offsets: offsets of the sequences in the block
+    :param align_params: encoded alignment parameters
+    """
+    block = shared_memory.SharedMemory(name=name)
+    _shared['block'] = block
+    _shared['letters'] = np.ndarray(int(offsets[-1]), dtype=np.uint8, buffer=block.buf)
+    _shared['offsets'] = offsets
+    _shared['params'] = align_params
+
+
+def shared_sequence(index: int) -> str:
+    """
+    Read a sequence from shared memory, in a worker process
+    :param index: index of the sequence
+    :return: sequence
+    """
+    offsets = _shared['offsets']
+    return _shared['letters'][offsets[index]:offsets[index + 1]].tobytes().decode('latin-1')
+
+
+def pair_score(align_params: AlignmentParameters, seq_a: str, seq_b: str) -> float:
+    """
+    Best alignment score of two sequences, without pointers nor traceback
+    :param align_params: encoded alignment parameters, whose mode, gap penalties and match scores are used
+    :param seq_a: first sequence
+    :param seq_b: second sequence
+    :return: best score
+    """
+    # a shallow copy shares the match score table
+    pair_params = copy.copy(align_params)
+    pair_params.seq_a, pair_params.seq_b = seq_a, seq_b
+    pair_params.codes_a = encode_sequence(seq_a, align_params.alphabet_a)
+    pair_params.codes_b = encode_sequence(seq_b, align_params.alphabet_b)
+    score, _ = Align.from_params(pair_params).find_best_score()
+    return score
+
+
+def block_job(rows: Tuple[int, int], cols: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int], np.ndarray]:
+    """
+    Score the pairs of a block of the upper triangle, in a worker process.
+    :param rows: (start, stop) of the rows of the block
+    :param cols: (start, stop) of the columns of the block
+    :return: (rows, cols, scores of the block), the pairs below the diagonal being mirrored from above it
+    """
+    sequences = {index: shared_sequence(index) for index in set(range(*rows)) | set(range(*cols))}
+    scores = np.full((rows[1] - rows[0], cols[1] - cols[0]), np.nan)
+    for i in range(*rows):
+        for j in range(max(i, cols[0]), cols[1]):
+            scores[i - rows[0], j - cols[0]] = pair_score(_shared['params'], sequences[i], sequences[j])
+            if rows[0] <= j < rows[1] and cols[0] <= i < cols[1]:
+                scores[j - rows[0], i - cols[0]] = scores[i - rows[0], j - cols[0]]
+    return rows, cols, scores
+
+
+def all_vs_all(sequences: List[str], align_params: AlignmentParameters, block_size: int = 32, workers: int = None,
+               checkpoint: str = None) -> np.ndarray:
+    """
+    Fill the symmetric matrix of the alignment scores of every pair of sequences, block by block across a pool of
+    worker processes.
+
+    :param sequences: sequences to align, over alphabet A and alphabet B of the alignment parameters
+    :param align_params: loaded alignment parameters (their own sequences are ignored)
+    :param block_size: number of rows and columns of a block
+    :param workers: number of worker processes (number of CPUs if None)
+    :param checkpoint: NumPy file (.npy) keeping the scores as blocks complete, resumed from if it exists and its
+        key (checkpoint + '.key') matches the sequences and parameters, discarded otherwise
+    :return: scores, scores[i, j] being the best score of sequence min(i, j) aligned with sequence max(i, j)
+    """
+    if align_params.codes_a is None:
+        align_params.encode()
+    # the pairs are encoded with the alphabets of encode()
+    align_params = copy.copy(align_params)
+    align_params.alphabet_a, align_params.alphabet_b = align_params.alphabets()
+    # check every letter before any worker starts
+    for sequence in sequences:
+        encode_sequence(sequence, align_params.alphabet_a)
+        encode_sequence(sequence, align_params.alphabet_b)
+    count = len(sequences)
+    if checkpoint is not None:
+        key, key_file = checkpoint_key(sequences, align_params), checkpoint + '.key'
+        if os.path.exists(checkpoint):
+            saved_key = None
+            if os.path.exists(key_file):
+                with open(key_file) as f:
+                    saved_key = f.read().strip()
+            if saved_key != key:
+                print("Checkpoint \"{}\" holds the scores of other sequences or parameters, starting over".format(
+                    checkpoint))
+                os.remove(checkpoint)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        scores = np.load(checkpoint, mmap_mode='r+')
+    elif checkpoint is not None:
+        scores = np.lib.format.open_memmap(checkpoint, mode='w+', dtype=np.float64, shape=(count, count))
+        scores[:] = np.nan
+        scores.flush()
+        with open(key_file, "w") as f:
+            f.write(key + '\n')
+    else:
+        scores = np.full((count, count), np.nan)
+    blocks = [(rows, cols) for rows, cols in block_pairs(count, block_size)
+              if np.isnan(scores[rows[0]:rows[1], cols[0]:cols[1]]).any()]
+
+    block, offsets = share_sequences(sequences)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_sequences,
+                                 initargs=(block.name, offsets, align_params)) as pool:
+            jobs = [pool.submit(block_job, rows, cols) for rows, cols in blocks]
+            for job in as_completed(jobs):
+                rows, cols, block_scores = job.result()
+                scores[rows[0]:rows[1], cols[0]:cols[1]] = block_scores
+                scores[cols[0]:cols[1], rows[0]:rows[1]] = block_scores.T
+                if checkpoint is not None:
+                    scores.flush()
+    finally:
+        block.close()
+        block.unlink()
+    return np.array(scores)
+
+
+def score_distances(scores: np.ndarray) -> np.ndarray:
+    """
+    Distances from alignment scores, 1 - S(i,j) / min(S(i,i), S(j,j)) clipped to [0, 1], so that a sequence is at
+    distance 0 from itself and pairs scoring 0 or less are at distance 1
+    :param scores: symmetric scores from all_vs_all
+    :return: symmetric distances
+    """
+    self_scores = np.diag(scores)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = 1 - scores / np.minimum(self_scores[:, None], self_scores[None, :])
+    distances = np.clip(np.nan_to_num(distances, nan=1.0), 0, 1)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def write_matrix(names: List[str], matrix: np.ndarray, output_file: str) -> None:
+    """
+    Write a matrix as a tab separated table, with the sequence names as header and first column
+    :param names: names of the sequences
+    :param matrix: scores or distances
+    :param output_file: file path of the table
+    """
+    with open(output_file, "w") as f:
+        f.write('\t'.join([''] + names) + '\n')
+        for name, row in zip(names, matrix):
+            f.write('\t'.join([name] + [str(round(value, 3)) for value in row]) + '\n')
+
+
+def main():
+    """
+    Compute the all-vs-all distances of the sequences of a FASTA file from command line.
+    """
+    parser = argparse.ArgumentParser(description="All-vs-all alignment scores and distances of a set of sequences.")
+    parser.add_argument("input_file", help="alignment input file path, for the mode, gap penalties and match matrix")
+    parser.add_argument("sequences", help="FASTA file of the sequences")
+    parser.add_argument("output_file", help="file path to write the matrix to")
+    parser.add_argument("--block-size", type=int, default=32, help="number of rows and columns of a block")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--checkpoint", default=None, help="NumPy file to keep the completed blocks in and resume from")
+    parser.add_argument("--scores", action="store_true", help="write the alignment scores instead of distances")
+    args = parser.parse_args()
+
+    align_params = AlignmentParameters()
+    align_params.load_params_from_file(args.input_file)
+    names, sequences = zip(*read_fasta(args.sequences))
+    scores = all_vs_all(list(sequences), align_params, args.block_size, args.workers, args.checkpoint)
+    write_matrix(list(names), scores if args.scores else score_distances(scores), args.output_file)
+    print('Saved to', args.output_file)
+
+
+if __name__ == "__main__":
+    main()
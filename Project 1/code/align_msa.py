@@ -0,0 +1,225 @@
+"""
+Progressive multiple sequence alignment built on Align.
+
+1. The pairwise distances of the sequences are computed in parallel by align_distance (score-only alignments,
+   optionally kept in a checkpoint file so that a later run over the same sequences and parameters reuses them; a
+   checkpoint of other sequences or parameters is discarded).
+2. A guide tree is built from the distances, by UPGMA or neighbor joining, as a list of merges.
+3. Following the merges, profiles (blocks of aligned sequences) are aligned to each other with the affine gap model
+   of Align (dx, ex, dy, ey, in global mode): profile columns are encoded as their positions, and the match score
+   of two columns is the average match score of their pairs of letters, gaps scoring 0.
+
+The output is a FASTA file of the aligned sequences, in input order, gaps being written as '_'.
+
+Usage: python align_msa.py input_file sequences output_file [--tree upgma|nj] [--workers N] [--block-size N]
+       [--checkpoint FILE]
+  where the gap penalties and match matrix come from the alignment input file, and sequences is a FASTA file
+  (optionally gzipped).
+"""
+
+import argparse
+import copy
+from typing import List, Tuple
+import numpy as np
+from align import Align, AlignmentParameters, read_fasta
+from align_distance import all_vs_all, score_distances
+
+# letter of the gaps in the aligned sequences, as in the align.py output
+GAP = '_'
+# guide tree methods
+TREE_METHODS = ('upgma', 'nj')
+
+
+def upgma(distances: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Guide tree by UPGMA: repeatedly merge the two closest clusters, the distance to a merged cluster being the
+    size-weighted average of the distances to its two halves
+    :param distances: symmetric distances of the sequences
+    :return: merges (node, node), nodes 0..n-1 being the sequences and node n+k the cluster of the k-th merge
+    """
+    count = len(distances)
+    distances = np.array(distances, dtype=np.float64)
+    np.fill_diagonal(distances, np.inf)
+    sizes = np.ones(count)
+    nodes = list(range(count))
+    merges = []
+    for step in range(count - 1):
+        i, j = sorted(np.unravel_index(np.argmin(distances), distances.shape))
+        merges.append((nodes[i], nodes[j]))
+        merged = (sizes[i] * distances[i] + sizes[j] * distances[j]) / (sizes[i] + sizes[j])
+        distances[i, :], distances[:, i] = merged, merged
+        distances[j, :], distances[:, j] = np.inf, np.inf
+        distances[i, i] = np.inf
+        sizes[i] += sizes[j]
+        nodes[i] = count + step
+    return merges
+
+
+def neighbor_joining(distances: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Guide tree by neighbor joining: repeatedly join the pair minimizing the Q criterion, the last two nodes being
+    joined at the root
+    :param distances: symmetric distances of the sequences
+    :return: merges (node, node), nodes 0..n-1 being the sequences and node n+k the cluster of the k-th merge
+    """
+    count = len(distances)
+    distances = np.array(distances, dtype=np.float64)
+    nodes = list(range(count))
+    active = list(range(count))
+    merges = []
+    for step in range(count - 1):
+        if len(active) == 2:
+            i, j = active
+        else:
+            sub = distances[np.ix_(active, active)]
+            totals = sub.sum(axis=1)
+            q = (len(active) - 2) * sub - totals[:, None] - totals[None, :]
+            np.fill_diagonal(q, np.inf)
+            a, b = sorted(np.unravel_index(np.argmin(q), q.shape))
+            i, j = active[a], active[b]
+        merges.append((nodes[i], nodes[j]))
+        joined = (distances[i] + distances[j] - distances[i, j]) / 2
+        distances[i, :], distances[:, i] = joined, joined
+        distances[i, i] = 0
+        nodes[i] = count + step
+        active.remove(j)
+    return merges
+
+
+def profile_counts(rows: List[str], alphabet: str) -> np.ndarray:
+    """
+    Number of each letter in each column of a profile
+    :param rows: aligned sequences of the profile, all of the same length
+    :param alphabet: letters to count (gaps aren't counted)
+    :return: counts, of shape (columns, letters)
+    """
+    letters = np.frombuffer(''.join(rows).encode('latin-1'), dtype=np.uint8).reshape(len(rows), -1)
+    return np.stack([np.sum(letters == ord(letter), axis=0) for letter in alphabet], axis=1).astype(np.float64)
+
+
+def align_profiles(align_params: AlignmentParameters, rows_a: List[str], rows_b: List[str]) -> List[str]:
+    """
+    Align two profiles with Align in global mode, their columns standing for the letters of the sequences
+    :param align_params: encoded alignment parameters, for the gap penalties and match scores
+    :param rows_a: aligned sequences of the first profile
+    :param rows_b: aligned sequences of the second profile
+    :return: aligned sequences of the merged profile, the rows of the first profile then those of the second
+    """
+    alphabet_a, alphabet_b = align_params.alphabets()
+    counts_a, counts_b = profile_counts(rows_a, alphabet_a), profile_counts(rows_b, alphabet_b)
+    # a shallow copy shares everything but what is replaced here
+    params = copy.copy(align_params)
+    params.global_alignment = True
+    params.score_table = counts_a @ align_params.score_table @ counts_b.T / (len(rows_a) * len(rows_b))
+    params.codes_a, params.codes_b = np.arange(len(counts_a)), np.arange(len(counts_b))
+    # consensus letters, only their number matters to Align
+    params.seq_a = ''.join(alphabet_a[k] for k in np.argmax(counts_a, axis=1))
+    params.seq_b = ''.join(alphabet_b[k] for k in np.argmax(counts_b, axis=1))
+    align = Align.from_params(params)
+    align.populate_score_matrices()
+    _, start_points = align.find_traceback_start()
+    trace = next(align.iter_tracebacks(start_points, 1))
+
+    # column of each profile in each merged column, -1 for gaps; the unaligned ends are gapped in the other profile
+    columns_a, columns_b = [], []
+    position_a, position_b = 0, 0
+    steps = [(row, col, name) for row, col, name in reversed(trace) if row > 0 and col > 0]
+    for row, col, name in steps + [(len(counts_a) + 1, len(counts_b) + 1, 'M')]:
+        before_a, before_b = row - (name != 'Iy'), col - (name != 'Ix')
+        columns_a += list(range(position_a, before_a)) + [-1] * (before_b - position_b)
+        columns_b += [-1] * (before_a - position_a) + list(range(position_b, before_b))
+        if (row, col) == (len(counts_a) + 1, len(counts_b) + 1):
+            break
+        columns_a.append(row - 1 if name != 'Iy' else -1)
+        columns_b.append(col - 1 if name != 'Ix' else -1)
+        position_a, position_b = row, col
+    return gapped_rows(rows_a, np.array(columns_a)) + gapped_rows(rows_b, np.array(columns_b))
+
+
+def gapped_rows(rows: List[str], columns: np.ndarray) -> List[str]:
+    """
+    Rearrange the columns of a profile, inserting gap columns
+    :param rows: aligned sequences of the profile
+    :param columns: column of the profile for each new column, -1 for a gap column
+    :return: aligned sequences with the new columns
+    """
+    letters = np.frombuffer(''.join(rows).encode('latin-1'), dtype=np.uint8).reshape(len(rows), -1)
+    gapped = np.where(columns >= 0, letters[:, np.maximum(columns, 0)], ord(GAP)).astype(np.uint8)
+    return [row.tobytes().decode('latin-1') for row in gapped]
+
+
+def progressive_alignment(align_params: AlignmentParameters, sequences: List[str],
+                          merges: List[Tuple[int, int]]) -> List[str]:
+    """
+    Align the sequences profile by profile, following the merges of a guide tree
+    :param align_params: encoded alignment parameters
+    :param sequences: sequences to align
+    :param merges: merges of upgma or neighbor_joining
+    :return: aligned sequences, in input order
+    """
+    # sequence indices and aligned rows of each node of the tree
+    profiles = {index: ([index], [sequence]) for index, sequence in enumerate(sequences)}
+    for step, (left, right) in enumerate(merges):
+        (indices_a, rows_a), (indices_b, rows_b) = profiles.pop(left), profiles.pop(right)
+        profiles[len(sequences) + step] = (indices_a + indices_b, align_profiles(align_params, rows_a, rows_b))
+    aligned = [None] * len(sequences)
+    for indices, rows in profiles.values():
+        for index, row in zip(indices, rows):
+            aligned[index] = row
+    return aligned
+
+
+def multiple_alignment(sequences: List[str], align_params: AlignmentParameters, tree: str = 'upgma',
+                       workers: int = None, block_size: int = 32, checkpoint: str = None) -> List[str]:
+    """
+    Progressive multiple alignment of sequences.
+
+    :param sequences: sequences to align, over alphabet A and alphabet B of the alignment parameters
+    :param align_params: loaded alignment parameters (their own sequences are ignored)
+    :param tree: guide tree method, 'upgma' or 'nj'
+    :param workers: number of worker processes of the distance computation (number of CPUs if None)
+    :param block_size: number of rows and columns of a block of the distance computation
+    :param checkpoint: NumPy file keeping the pairwise scores, reused if it was computed for the same sequences and
+        parameters (see align_distance.all_vs_all)
+    :return: aligned sequences, in input order
+    """
+    if tree not in TREE_METHODS:
+        raise ValueError("Unknown tree \"{}\", should be in {{{}}}".format(tree, ', '.join(TREE_METHODS)))
+    if align_params.codes_a is None:
+        align_params.encode()
+    if len(sequences) < 2:
+        return list(sequences)
+    distances = score_distances(all_vs_all(sequences, align_params, block_size, workers, checkpoint))
+    merges = upgma(distances) if tree == 'upgma' else neighbor_joining(distances)
+    return progressive_alignment(align_params, sequences, merges)
+
+
+def main():
+    """
+    Align the sequences of a FASTA file from command line.
+    """
+    parser = argparse.ArgumentParser(description="Progressive multiple alignment of the sequences of a FASTA file.")
+    parser.add_argument("input_file", help="alignment input file path, for the gap penalties and match matrix")
+    parser.add_argument("sequences", help="FASTA file of the sequences")
+    parser.add_argument("output_file", help="FASTA file to write the aligned sequences to")
+    parser.add_argument("--tree", choices=TREE_METHODS, default='upgma', help="guide tree method")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--block-size", type=int, default=32, help="number of rows and columns of a distance block")
+    parser.add_argument("--checkpoint", default=None,
+                        help="NumPy file caching the pairwise scores across runs over the same sequences and "
+                             "parameters")
+    args = parser.parse_args()
+
+    align_params = AlignmentParameters()
+    align_params.load_params_from_file(args.input_file)
+    names, sequences = zip(*read_fasta(args.sequences))
+    aligned = multiple_alignment(list(sequences), align_params, args.tree, args.workers, args.block_size,
+                                 args.checkpoint)
+    with open(args.output_file, "w") as f:
+        for name, row in zip(names, aligned):
+            f.write(">{}\n{}\n".format(name, row))
+    print('Saved to', args.output_file)
+
+
+if __name__ == "__main__":
+    main()
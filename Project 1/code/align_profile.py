@@ -0,0 +1,131 @@
+"""
+Query profile local alignment scores, for scanning one query against many targets.
+
+The match scores of the query against every letter of the target alphabet are looked up once, into a query
+profile. The targets are then scored in batches, column by column: a batch is an array of shape (targets, query
+positions), so that a column of every target of the batch is updated at once. The gaps in the query (Ix) are
+unrolled down the column into a running maximum (np.maximum.accumulate), as in the column fill of Align, instead of
+being extended position by position.
+
+The scores are the local alignment scores of Align, with the same rounding.
+
+Usage: python align_profile.py input_file targets_file [--batch N]
+  where the query, gap penalties and match matrix come from the alignment input file (sequence A being the query),
+  and targets_file lists one target sequence per line.
+"""
+
+import argparse
+from typing import List
+import numpy as np
+from align import AlignmentParameters, encode_sequence
+
+# number of targets scored at once when the batch size isn't given
+BATCH_TARGETS = 64
+
+
+class QueryProfile(object):
+    """
+    Match scores of a query against every letter of the target alphabet, and the local alignment scoring of batches
+    of targets against it.
+    """
+
+    def __init__(self, align_params: AlignmentParameters, batch: int = None) -> None:
+        """
+        Build the profile of sequence A of the alignment parameters.
+
+        :param align_params: loaded alignment parameters, seq_a is the query and alphabet_b the target alphabet
+        :param batch: number of targets scored at once (BATCH_TARGETS if None)
+        """
+        if align_params.global_alignment:
+            raise ValueError("Query profiles only compute local alignment scores")
+        if align_params.codes_a is None:
+            align_params.encode()
+        self.dx, self.ex = align_params.dx, align_params.ex
+        self.dy, self.ey = align_params.dy, align_params.ey
+        self.alphabet_b = align_params.alphabets()[1]
+        self.batch = batch or BATCH_TARGETS
+        # position 0 is the border row of the score matrices, positions 1..n the query
+        self.length = len(align_params.codes_a) + 1
+        # profile[b, i] is the score of matching query position i with letter b of the target alphabet, -inf for
+        # the border
+        self.profile = np.full((len(self.alphabet_b), self.length), -np.inf)
+        self.profile[:, 1:] = align_params.score_table[align_params.codes_a].T
+
+    def score(self, target: str) -> float:
+        """
+        Best local alignment score of the query against a target
+        :param target: target sequence, over the target alphabet
+        :return: best local alignment score
+        """
+        return self.score_batch([target])[0]
+
+    def score_batch(self, targets: List[str]) -> List[float]:
+        """
+        Best local alignment score of the query against each target of a batch, scored together.
+
+        The targets are padded to the longest one, and the columns past the end of a target don't count in its
+        best score.
+
+        :param targets: target sequences, over the target alphabet
+        :return: best local alignment scores, in the order of the targets
+        """
+        dx, ex, dy, ey = self.dx, self.ex, self.dy, self.ey
+        lengths = np.array([len(target) for target in targets], dtype=np.int64)
+        codes = np.zeros((len(targets), int(lengths.max(initial=0))), dtype=np.int64)
+        for t, target in enumerate(targets):
+            codes[t, :len(target)] = encode_sequence(target, self.alphabet_b)
+        shape = (len(targets), self.length)
+        m_scores, ix_scores, iy_scores = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        best = np.zeros(len(targets))
+        steps = ey * np.arange(self.length)
+        opened = np.full(shape, -np.inf)
+        for col in range(codes.shape[1]):
+            # M: from (row-1, col-1) in any matrix, the whole column at once
+            diagonal = np.maximum(np.maximum(m_scores, ix_scores), iy_scores)
+            new_m = np.zeros(shape)
+            new_m[:, 1:] = np.maximum(np.round(diagonal[:, :-1] + self.profile[codes[:, col], 1:], 3), 0)
+            # Iy: from (row, col-1) in M or Iy, the whole column at once
+            iy_scores = np.maximum(np.round(np.maximum(m_scores - dx, iy_scores - ex), 3), 0)
+            iy_scores[:, 0] = 0
+            m_scores = new_m
+            # Ix: from (row-1, col) in M or Ix, unrolled down the query into a running max over M(k) - dy - ey * (i-1-k)
+            opened[:, 1:] = m_scores[:, :-1] - dy + steps[1:]
+            ix_scores = np.maximum(np.round(np.maximum.accumulate(opened, axis=1) - steps, 3), 0)
+            column_best = np.max(np.maximum(np.maximum(m_scores, ix_scores), iy_scores), axis=1)
+            best = np.where(lengths > col, np.maximum(best, column_best), best)
+        return best.tolist()
+
+    def scan(self, targets: List[str]) -> List[float]:
+        """
+        Best local alignment score of the query against each target, batch by batch
+        :param targets: target sequences
+        :return: scores, in the order of the targets
+        """
+        scores = []
+        for start in range(0, len(targets), self.batch):
+            scores.extend(self.score_batch(targets[start:start + self.batch]))
+        return scores
+
+
+def main():
+    """
+    Score the query of an alignment input file against the targets of a file from command line.
+    """
+    parser = argparse.ArgumentParser(description="Local alignment scores of one query against many targets.")
+    parser.add_argument("input_file", help="alignment input file path, its sequence A is the query")
+    parser.add_argument("targets_file", help="file listing one target sequence per line")
+    parser.add_argument("--batch", type=int, default=None, help="number of targets scored at once")
+    args = parser.parse_args()
+
+    align_params = AlignmentParameters()
+    align_params.load_params_from_file(args.input_file)
+    align_params.global_alignment = False
+    with open(args.targets_file) as f:
+        targets = [line.strip() for line in f if line.strip()]
+    profile = QueryProfile(align_params, args.batch)
+    for index, score in enumerate(profile.scan(targets)):
+        print("{}\t{}".format(index, round(score, 1)))
+
+
+if __name__ == "__main__":
+    main()
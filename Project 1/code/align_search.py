@@ -0,0 +1,312 @@
+"""
+Seed-and-extend search of one query against a FASTA database, built on Align.
+
+The database is encoded once into a sorted k-mer index. The k-mers of the query are looked up in it, and the
+shared k-mers (seeds) are grouped by target and diagonal. Each candidate diagonal is extended without gaps until
+its score drops more than xdrop below the best score seen (X-drop), and the best segment of each target is then
+aligned with gaps by Align if it scores at least min_ungapped, in local mode and only in a window around the
+segment; the window is widened while that improves the score, up to a margin of max_window. The best hits are kept
+in a heap.
+
+The output file lists the hits from best to worst, each as a "> target name" line followed by the alignment in
+the align.py output format.
+
+Usage: python align_search.py input_file database output_file [--k K] [--top N] [--xdrop X] [--window W]
+                              [--max-window W] [--min-seeds N] [--min-ungapped S]
+  where the query, gap penalties and match matrix come from the alignment input file (sequence A being the query),
+  and database is a FASTA file (optionally gzipped) over alphabet B.
+"""
+
+import argparse
+import heapq
+from typing import List, Tuple
+import numpy as np
+from align import Align, AlignmentParameters, encode_sequence, read_fasta
+
+
+class KmerIndex(object):
+    """
+    Sorted index of every k-mer of a database of sequences
+    """
+
+    def __init__(self, names: List[str], sequences: List[str], alphabet: str, k: int) -> None:
+        """
+        Encode the database and index its k-mers.
+
+        :param names: names of the sequences
+        :param sequences: database sequences, over alphabet
+        :param alphabet: letters of the sequences
+        :param k: length of the k-mers
+        """
+        if len(alphabet) ** k >= 2 ** 63:
+            raise ValueError("k = {} is too large for an alphabet of {} letters".format(k, len(alphabet)))
+        self.names = names
+        self.alphabet = alphabet
+        self.k = k
+        # all sequences end to end, sequence t spanning codes[offsets[t]:offsets[t + 1]]
+        self.codes = encode_sequence(''.join(sequences), alphabet)
+        self.offsets = np.concatenate([[0], np.cumsum([len(sequence) for sequence in sequences])]).astype(np.int64)
+        # k-mers that don't cross the end of their sequence, sorted by code
+        kmers = self.kmer_codes(self.codes)
+        ends = np.repeat(self.offsets[1:], np.diff(self.offsets))[:len(kmers)]
+        positions = np.nonzero(np.arange(len(kmers)) + k <= ends)[0]
+        order = np.argsort(kmers[positions], kind='stable')
+        self.kmers = kmers[positions][order]
+        self.positions = positions[order]
+
+    @classmethod
+    def from_fasta(cls, fasta_file: str, alphabet: str, k: int) -> 'KmerIndex':
+        """
+        Index the sequences of a FASTA file
+        :param fasta_file: path to the FASTA file
+        :param alphabet: letters of the sequences
+        :param k: length of the k-mers
+        :return: KmerIndex object
+        """
+        records = list(read_fasta(fasta_file))
+        return cls([name for name, _ in records], [sequence for _, sequence in records], alphabet, k)
+
+    def kmer_codes(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Code of the k-mer starting at each position, as a number in base len(alphabet)
+        :param codes: encoded sequence
+        :return: int64 array of length len(codes) - k + 1
+        """
+        count = len(codes) - self.k + 1
+        kmers = np.zeros(max(count, 0), dtype=np.int64)
+        for t in range(self.k):
+            kmers = kmers * len(self.alphabet) + codes[t:t + count]
+        return kmers
+
+    def sequence(self, target: int) -> np.ndarray:
+        """
+        Encoded sequence of a target
+        :param target: index of the target
+        """
+        return self.codes[self.offsets[target]:self.offsets[target + 1]]
+
+    def seeds(self, query: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find the k-mers shared by the query and the database
+        :param query: query sequence, k-mers with letters outside of the database alphabet are skipped
+        :return: (query positions, targets, target positions) of every seed, by query position
+        """
+        query_codes = np.array([self.alphabet.find(letter) for letter in query], dtype=np.int64)
+        query_kmers = self.kmer_codes(np.maximum(query_codes, 0))
+        unknown = np.concatenate([[0], np.cumsum(query_codes < 0)])
+        known = unknown[self.k:] == unknown[:len(query_kmers)]
+        first = np.searchsorted(self.kmers, query_kmers, 'left')
+        counts = np.where(known, np.searchsorted(self.kmers, query_kmers, 'right') - first, 0)
+        # expand each query k-mer into its range of the index
+        query_positions = np.repeat(np.arange(len(query_kmers)), counts)
+        ranks = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+        positions = self.positions[ranks]
+        targets = np.searchsorted(self.offsets, positions, 'right') - 1
+        return query_positions, targets, positions - self.offsets[targets]
+
+
+class SeedSearch(object):
+    """
+    Seed-and-extend local alignment search of queries against an indexed database
+    """
+
+    def __init__(self, align_params: AlignmentParameters, index: KmerIndex, xdrop: float = 10.0,
+                 window: int = 32, min_seeds: int = 1, min_ungapped: float = 0.0, max_window: int = 1024) -> None:
+        """
+        Initialize SeedSearch object.
+
+        :param align_params: gap penalties and match matrix, alignment is always local
+        :param index: k-mer index of the database
+        :param xdrop: stop extending a diagonal when its score drops this far below its best score
+        :param window: margin first added around extended diagonals for the gapped alignment
+        :param min_seeds: number of seeds a diagonal needs to be extended
+        :param min_ungapped: ungapped score the best segment of a target needs to be extended with gaps
+        :param max_window: largest margin of the windows, the margin stops doubling once it reaches it
+        """
+        if align_params.score_table is None:
+            align_params.encode()
+        self.align_params = align_params
+        self.index = index
+        # codes of the index alphabet in alphabet B, the alphabet of the match score table
+        self.translation = encode_sequence(index.alphabet, align_params.alphabet_b)
+        self.xdrop = xdrop
+        self.window = window
+        self.min_seeds = min_seeds
+        self.min_ungapped = min_ungapped
+        self.max_window = max_window
+
+    def search(self, query: str, top: int = 10) -> List[Tuple[float, str, Align]]:
+        """
+        Find the best local alignments of a query in the database.
+
+        :param query: query sequence, over alphabet A
+        :param top: number of hits to keep
+        :return: (score, target name, Align object of the window) of the best hits, from best to worst
+        """
+        query_codes = encode_sequence(query, self.align_params.alphabet_a)
+        # best ungapped segment of each target
+        segments = {}
+        for query_position, target, target_position in self.__candidates__(query):
+            segment = self.__extendUngapped__(query_codes, target, query_position, target_position)
+            if target not in segments or segment[0] > segments[target][0]:
+                segments[target] = segment
+        # gapped alignment around the best segment of each target that scores high enough without gaps, keeping the
+        # best hits in a min heap
+        hits = []
+        for target, segment in segments.items():
+            if segment[0] < self.min_ungapped:
+                continue
+            score, align = self.__extendGapped__(query, target, segment)
+            hit = (score, -target, align)
+            if len(hits) < top:
+                heapq.heappush(hits, hit)
+            elif hit[:2] > hits[0][:2]:
+                heapq.heapreplace(hits, hit)
+        hits.sort(key=lambda hit: hit[:2], reverse=True)
+        return [(score, self.index.names[-target], align) for score, target, align in hits]
+
+    def __candidates__(self, query: str) -> List[Tuple[int, int, int]]:
+        """
+        Diagonals of the targets with at least min_seeds seeds
+        :param query: query sequence
+        :return: (query position, target, target position) of the first seed of each diagonal
+        """
+        query_positions, targets, target_positions = self.index.seeds(query)
+        diagonals = target_positions - query_positions + len(query)
+        keys = targets * (len(query) + len(self.index.codes) + 1) + diagonals
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        first = first[counts >= self.min_seeds]
+        return list(zip(query_positions[first].tolist(), targets[first].tolist(), target_positions[first].tolist()))
+
+    def __extendUngapped__(self, query_codes: np.ndarray, target: int, query_position: int,
+                           target_position: int) -> Tuple[float, int, int, int]:
+        """
+        Extend a seed along its diagonal in both directions with X-drop
+        :param query_codes: encoded query
+        :param target: index of the target
+        :param query_position: query position of the seed
+        :param target_position: target position of the seed
+        :return: (score, query start, query end, target start) of the best segment, ends excluded
+        """
+        target_codes = self.translation[self.index.sequence(target)]
+        table = self.align_params.score_table
+        # forward from the seed, then backward from the position before it
+        forward = min(len(query_codes) - query_position, len(target_codes) - target_position)
+        scores = table[query_codes[query_position:query_position + forward],
+                       target_codes[target_position:target_position + forward]]
+        forward_score, forward_length = self.__xdrop__(scores)
+        backward = min(query_position, target_position)
+        scores = table[query_codes[query_position - backward:query_position][::-1],
+                       target_codes[target_position - backward:target_position][::-1]]
+        backward_score, backward_length = self.__xdrop__(scores)
+        return (forward_score + backward_score, query_position - backward_length, query_position + forward_length,
+                target_position - backward_length)
+
+    def __xdrop__(self, scores: np.ndarray) -> Tuple[float, int]:
+        """
+        Best prefix of a run of scores, stopping once the running score drops more than xdrop below its best
+        :param scores: scores along the extension
+        :return: (score, length) of the best prefix
+        """
+        if len(scores) == 0:
+            return 0.0, 0
+        running = np.cumsum(scores)
+        best = np.maximum.accumulate(np.maximum(running, 0))
+        dropped = np.nonzero(running < best - self.xdrop)[0]
+        stop = dropped[0] if len(dropped) else len(scores)
+        if stop == 0 or np.max(running[:stop]) <= 0:
+            return 0.0, 0
+        length = int(np.argmax(running[:stop])) + 1
+        return float(running[length - 1]), length
+
+    def __extendGapped__(self, query: str, target: int, segment: Tuple[float, int, int, int]) -> Tuple[float, Align]:
+        """
+        Local alignment score in a window around a segment, doubling the margin of the window until the score
+        stops improving, the margin reaches max_window or the window covers both sequences
+        :param query: query sequence
+        :param target: index of the target
+        :param segment: (score, query start, query end, target start) from __extendUngapped__
+        :return: (score, Align object of the last window, not populated)
+        """
+        target_length = self.index.offsets[target + 1] - self.index.offsets[target]
+        margin, previous_score = min(self.window, self.max_window), None
+        while True:
+            align = self.__windowAlign__(query, target, segment, margin)
+            score, _ = align.find_best_score()
+            whole = align.nrow - 1 == len(query) and align.ncol - 1 == target_length
+            stable = previous_score is not None and score < previous_score + 10 ** (-6)
+            if whole or stable or margin >= self.max_window:
+                return score, align
+            margin, previous_score = min(2 * margin, self.max_window), score
+
+    def __windowAlign__(self, query: str, target: int, segment: Tuple[float, int, int, int], margin: int) -> Align:
+        """
+        Local alignment of the window around a segment
+        :param query: query sequence
+        :param target: index of the target
+        :param segment: (score, query start, query end, target start) from __extendUngapped__
+        :param margin: number of positions added on each side of the segment
+        :return: Align object of the window, not populated yet
+        """
+        _, query_start, query_end, target_start = segment
+        target_end = target_start + query_end - query_start
+        target_length = self.index.offsets[target + 1] - self.index.offsets[target]
+        query_window = slice(max(0, query_start - margin), min(len(query), query_end + margin))
+        target_window = slice(max(0, target_start - margin), min(target_length, target_end + margin))
+
+        params = AlignmentParameters()
+        params.__dict__.update(self.align_params.__dict__)
+        params.global_alignment = False
+        params.seq_a = query[query_window]
+        params.seq_b = ''.join(self.index.alphabet[code] for code in self.index.sequence(target)[target_window])
+        params.codes_a = encode_sequence(params.seq_a, self.align_params.alphabet_a)
+        params.codes_b = self.translation[self.index.sequence(target)[target_window]]
+        return Align.from_params(params)
+
+
+def write_hits(hits: List[Tuple[float, str, Align]], output_file: str, max_alignments: int = 1) -> None:
+    """
+    Write the hits of a search, each as a "> target name" line and its alignments in the align.py output format
+    :param hits: hits from SeedSearch.search
+    :param output_file: file path to write the hits
+    :param max_alignments: number of co-optimal alignments to write per hit
+    """
+    with open(output_file, "w") as f:
+        for score, name, align in hits:
+            align.populate_score_matrices()
+            _, start_points = align.find_traceback_start()
+            alignments = [align.__printOutput__(trace) for trace in align.iter_tracebacks(start_points, max_alignments)]
+            f.write("> {}\n".format(name))
+            f.write(align.format_result(score, alignments))
+            f.write("\n")
+    print('Saved to', output_file)
+
+
+def main():
+    """
+    Search the query of an alignment input file against a FASTA database from command line.
+    """
+    parser = argparse.ArgumentParser(description="Seed-and-extend local alignment search against a FASTA database.")
+    parser.add_argument("input_file", help="alignment input file path, its sequence A is the query")
+    parser.add_argument("database", help="FASTA file of the sequences to search")
+    parser.add_argument("output_file", help="file path to write the hits")
+    parser.add_argument("--k", type=int, default=8, help="length of the seeds")
+    parser.add_argument("--top", type=int, default=10, help="number of hits to write")
+    parser.add_argument("--xdrop", type=float, default=10.0, help="X-drop of the ungapped extension")
+    parser.add_argument("--window", type=int, default=32, help="first margin of the gapped extension windows")
+    parser.add_argument("--max-window", type=int, default=1024, help="largest margin of the gapped extension windows")
+    parser.add_argument("--min-seeds", type=int, default=1, help="seeds a diagonal needs to be extended")
+    parser.add_argument("--min-ungapped", type=float, default=0.0,
+                        help="ungapped score a target needs to be extended with gaps")
+    args = parser.parse_args()
+
+    align_params = AlignmentParameters()
+    align_params.load_params_from_file(args.input_file)
+    index = KmerIndex.from_fasta(args.database, align_params.alphabet_b, args.k)
+    search = SeedSearch(align_params, index, args.xdrop, args.window, args.min_seeds, args.min_ungapped,
+                        args.max_window)
+    write_hits(search.search(align_params.seq_a, args.top), args.output_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Gap penalty sweep for align.py: aligns the two sequences of one input file under a grid of gap penalties.
+
+The input file is parsed and encoded once. The encoded sequences and match score table are handed to each worker
+process once, when the pool starts, and every setting of the grid then only replaces the four gap penalties.
+Settings are scored without pointers unless alignments are asked for.
+
+Usage: python align_sweep.py input_file scores_file [--dx 1,2] [--ex 0.5,1] [--dy 1,2] [--ey 0.5,1]
+       [--workers N] [--max-alignments N --output-dir DIR]
+  where each gap penalty defaults to its value in the input file, and the scores file is a tab separated table
+  with one row per setting.
+"""
+
+import argparse
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Union
+from align import Align, AlignmentParameters
+
+# (dx, ex, dy, ey)
+GapPenalties = Tuple[float, float, float, float]
+
+# encoded alignment parameters of the sweep, set once in each worker process
+_shared_params = None
+
+
+def gap_grid(align_params: AlignmentParameters, dx: List[float] = None, ex: List[float] = None,
+             dy: List[float] = None, ey: List[float] = None) -> List[GapPenalties]:
+    """
+    Every combination of the given gap penalties
+    :param align_params: loaded alignment parameters, whose penalties are used for the lists that aren't given
+    :param dx: gap opening penalties in seq_a (Iy)
+    :param ex: gap extension penalties in seq_a (Iy)
+    :param dy: gap opening penalties in seq_b (Ix)
+    :param ey: gap extension penalties in seq_b (Ix)
+    :return: (dx, ex, dy, ey) settings, in grid order
+    """
+    return list(itertools.product(dx or [align_params.dx], ex or [align_params.ex],
+                                  dy or [align_params.dy], ey or [align_params.ey]))
+
+
+def share_params(align_params: AlignmentParameters) -> None:
+    """
+    Keep the encoded alignment parameters for the settings evaluated by this process (pool initializer)
+    :param align_params: encoded alignment parameters
+    """
+    global _shared_params
+    _shared_params = align_params
+
+
+def sweep_job(gaps: GapPenalties, max_alignments: int) -> Tuple[GapPenalties, float, Union[str, None]]:
+    """
+    Align the shared sequences with one setting of gap penalties, in a worker process.
+    :param gaps: (dx, ex, dy, ey)
+    :param max_alignments: number of co-optimal alignments to trace back, 0 for the score only
+    :return: (gaps, best score, output file content in the format of align.py or None)
+    """
+    # a shallow copy shares the encoded sequences and the match score table
+    align_params = copy.copy(_shared_params)
+    align_params.dx, align_params.ex, align_params.dy, align_params.ey = gaps
+    align = Align.from_params(align_params)
+    if not max_alignments:
+        score, _ = align.find_best_score()
+        return gaps, score, None
+    align.populate_score_matrices()
+    score, start_points = align.find_traceback_start()
+    traces = align.iter_tracebacks(start_points, max_alignments)
+    return gaps, score, align.format_result(score, [align.__printOutput__(trace) for trace in traces])
+
+
+def run_sweep(align_params: AlignmentParameters, grid: List[GapPenalties], workers: int = None,
+              max_alignments: int = 0) -> List[Tuple[GapPenalties, float, Union[str, None]]]:
+    """
+    Align the sequences of the alignment parameters with every setting of a grid, across a pool of workers.
+
+    :param align_params: loaded alignment parameters
+    :param grid: (dx, ex, dy, ey) settings, e.g. from gap_grid
+    :param workers: number of worker processes (number of CPUs if None)
+    :param max_alignments: number of co-optimal alignments to trace back per setting, 0 for the scores only
+    :return: one (gaps, best score, output file content or None) per setting, in grid order
+    """
+    if align_params.codes_a is None:
+        align_params.encode()
+    with ProcessPoolExecutor(max_workers=workers, initializer=share_params, initargs=(align_params,)) as pool:
+        return list(pool.map(sweep_job, grid, itertools.repeat(max_alignments),
+                             chunksize=max(1, len(grid) // (4 * (workers or os.cpu_count() or 1)))))
+
+
+def write_scores(results: List[Tuple[GapPenalties, float, Union[str, None]]], scores_file: str) -> None:
+    """
+    Write the best score of each setting as a tab separated table
+    :param results: results of run_sweep
+    :param scores_file: file path of the table
+    """
+    with open(scores_file, "w") as f:
+        f.write("dx\tex\tdy\tey\tscore\n")
+        for gaps, score, _ in results:
+            f.write('\t'.join(str(value) for value in gaps + (score,)) + '\n')
+
+
+def write_alignments(results: List[Tuple[GapPenalties, float, Union[str, None]]], output_dir: str) -> None:
+    """
+    Write the alignments of each setting in the format of align.py, to output_dir/sweep_dx_ex_dy_ey.output
+    :param results: results of run_sweep, with alignments
+    :param output_dir: directory of the output files, created if missing
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for gaps, _, output in results:
+        name = "sweep_{}.output".format('_'.join(str(value) for value in gaps))
+        with open(os.path.join(output_dir, name), "w") as f:
+            f.write(output)
+
+
+def main():
+    """
+    Run a gap penalty sweep from command line.
+    """
+    def penalties(value):
+        return [float(penalty) for penalty in value.split(',')]
+
+    parser = argparse.ArgumentParser(description="Align the sequences of an input file under a grid of gap penalties.")
+    parser.add_argument("input_file", help="alignment input file path")
+    parser.add_argument("scores_file", help="file path to write the table of best scores")
+    parser.add_argument("--dx", type=penalties, default=None, help="comma separated gap opening penalties in A")
+    parser.add_argument("--ex", type=penalties, default=None, help="comma separated gap extension penalties in A")
+    parser.add_argument("--dy", type=penalties, default=None, help="comma separated gap opening penalties in B")
+    parser.add_argument("--ey", type=penalties, default=None, help="comma separated gap extension penalties in B")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPUs)")
+    parser.add_argument("--max-alignments", type=int, default=0,
+                        help="co-optimal alignments to trace back per setting (default: scores only)")
+    parser.add_argument("--output-dir", default=None, help="directory to write the alignments of each setting to")
+    args = parser.parse_args()
+    if args.max_alignments and args.output_dir is None:
+        parser.error("--max-alignments needs --output-dir")
+
+    align_params = AlignmentParameters()
+    align_params.load_params_from_file(args.input_file)
+    grid = gap_grid(align_params, args.dx, args.ex, args.dy, args.ey)
+    results = run_sweep(align_params, grid, args.workers, args.max_alignments)
+    write_scores(results, args.scores_file)
+    if args.max_alignments:
+        write_alignments(results, args.output_dir)
+    print("{} settings written to {}".format(len(results), args.scores_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,22 @@ Make sure align.py is located in the same directory, and the test_example.input
 """
 
 import unittest
+from unittest import mock
+import gzip
+import json
 import os
+import random
+import tempfile
+import time
 from align import *
 from align_quiz_functions import *
+from align_batch import collect_inputs, run_batch
+from align_profile import QueryProfile
+from align_search import KmerIndex, SeedSearch, read_fasta, write_hits
+from align_benchmark import compare, generate_pair, run_suite
+from align_sweep import gap_grid, run_sweep
+from align_distance import all_vs_all, score_distances
+from align_msa import align_profiles, multiple_alignment, neighbor_joining, upgma
 
 TEST_INPUT_FILE = "test_example.input"
 
@@ -57,6 +70,310 @@ class TestAlignmentClasses(unittest.TestCase):
         return
 
 
+    def test_score_matrix_array_storage(self):
+        """
+        Tests score matrix set + get methods with the packed array storage
+        """
+        score_matrix = ScoreMatrix('Ix', 4, 5, storage='array')
+        score_matrix.set_score(1, 2, 10.12345)
+        self.assertEqual(score_matrix.get_score(1, 2), 10.123)
+        score_matrix.set_pointers(2, 3, {(1, 3, 'M')})
+        score_matrix.set_pointers(2, 3, {(1, 3, 'Ix')})
+        self.assertEqual(score_matrix.get_pointers(2, 3), {(1, 3, 'M'), (1, 3, 'Ix')})
+        self.assertEqual(score_matrix.get_pointers(1, 3), set())
+        # Ix entries can only point to the entry above
+        with self.assertRaises(ValueError):
+            score_matrix.set_pointers(2, 3, {(1, 2, 'M')})
+        with self.assertRaises(ValueError):
+            ScoreMatrix('test', 4, 5, storage='array')
+        return
+
+    def test_storage_equivalence(self):
+        """
+        Tests that object and array storage fill the same scores and pointers
+        """
+        aligns = [Align(TEST_INPUT_FILE, "", storage=storage) for storage in ['object', 'array']]
+        for align in aligns:
+            align.populate_score_matrices()
+        for name in ['m_matrix', 'ix_matrix', 'iy_matrix']:
+            object_matrix, array_matrix = getattr(aligns[0], name), getattr(aligns[1], name)
+            for row in range(object_matrix.nrow):
+                for col in range(object_matrix.ncol):
+                    self.assertEqual(object_matrix.get_score(row, col), array_matrix.get_score(row, col))
+                    self.assertEqual(object_matrix.get_pointers(row, col), array_matrix.get_pointers(row, col))
+        return
+
+    def test_wavefront_fill(self):
+        """
+        Tests that the anti-diagonal fill gives the same scores and pointers as update(i,j) on every example
+        """
+        example_dir, _ = self.__testPaths__()
+        for example in sorted(os.listdir(example_dir)):
+            if not example.endswith('.input'):
+                continue
+            input_path = os.path.join(example_dir, example)
+            cell_align = Align(input_path, "", storage='object')
+            wave_align = Align(input_path, "", storage='array')
+            cell_align.populate_score_matrices()
+            wave_align.populate_score_matrices()
+            for name in ['m_matrix', 'ix_matrix', 'iy_matrix']:
+                cell_matrix, wave_matrix = getattr(cell_align, name), getattr(wave_align, name)
+                for row in range(cell_matrix.nrow):
+                    for col in range(cell_matrix.ncol):
+                        self.assertEqual(cell_matrix.get_score(row, col), wave_matrix.get_score(row, col))
+                        self.assertEqual(cell_matrix.get_pointers(row, col), wave_matrix.get_pointers(row, col))
+        return
+
+    def test_banded_alignment(self):
+        """
+        Tests that a band covering the whole matrices gives the full alignment, and that narrow bands only store
+        their diagonals
+        """
+        example_dir, output_dir = self.__testPaths__()
+        output_path = os.path.join(output_dir, "banded.output")
+        for example in sorted(os.listdir(example_dir)):
+            if not example.endswith('.input'):
+                continue
+            input_path = os.path.join(example_dir, example)
+            full_align = Align(input_path, output_path)
+            full_align.align()
+            band_align = Align(input_path, output_path)
+            band_align.align(band=max(full_align.nrow, full_align.ncol))
+            self.assertEqual(full_align.alignment_result, band_align.alignment_result)
+            auto_align = Align(input_path, output_path)
+            auto_align.align(band='auto')
+            self.assertEqual(full_align.alignment_result.split('\n')[0], auto_align.alignment_result.split('\n')[0])
+
+            narrow_align = Align(input_path, output_path)
+            narrow_align.align(band=1)
+            low, high = narrow_align.m_matrix.band
+            self.assertEqual(narrow_align.m_matrix.scores.shape, (narrow_align.nrow, high - low + 3))
+            self.assertEqual(narrow_align.m_matrix.get_score(narrow_align.nrow - 1, 0), -float('inf'))
+            self.assertLessEqual(float(narrow_align.alignment_result.split('\n')[0]),
+                                 float(full_align.alignment_result.split('\n')[0]))
+        with self.assertRaises(ValueError):
+            Align(input_path, output_path, storage='bits').align(band=1)
+        os.remove(output_path)
+        return
+
+    def test_score_only(self):
+        """
+        Tests that the score-only pass finds the best score and one of the traceback starts without allocating
+        the score matrices
+        """
+        example_dir, output_dir = self.__testPaths__()
+        output_path = os.path.join(output_dir, "score_only.output")
+        for example in sorted(os.listdir(example_dir)):
+            if not example.endswith('.input'):
+                continue
+            input_path = os.path.join(example_dir, example)
+            full_align = Align(input_path, output_path)
+            full_align.align_params.load_params_from_file(input_path)
+            full_align.populate_score_matrices()
+            full_score, start_points = full_align.find_traceback_start()
+            score_align = Align(input_path, output_path)
+            score_align.align(score_only=True)
+            self.assertIsNone(score_align.m_matrix)
+            self.assertEqual(score_align.alignment_result, str(round(full_score, 1)) + '\n\n')
+            score, end = score_align.find_best_score()
+            self.assertEqual(score, full_score)
+            self.assertIn(end, start_points)
+        os.remove(output_path)
+        return
+
+    def test_query_profile(self):
+        """
+        Tests that the query profile scores match local alignment scores, whatever the number of targets per batch
+        """
+        example_dir, _ = self.__testPaths__()
+        for example in sorted(os.listdir(example_dir)):
+            if not example.endswith('.input'):
+                continue
+            align = Align(os.path.join(example_dir, example), "")
+            align.align_params.load_params_from_file(align.input_file)
+            align.align_params.global_alignment = False
+            seq_b = align.align_params.seq_b
+            targets = [seq_b, seq_b[::-1], seq_b[len(seq_b) // 2:] * 3]
+            for batch in [None, 1, 2]:
+                profile = QueryProfile(align.align_params, batch)
+                scores = profile.scan(targets)
+                for target, score in zip(targets, scores):
+                    align.align_params.seq_b = target
+                    align.align_params.encode()
+                    align.ncol = len(target) + 1
+                    self.assertEqual(score, align.find_best_score()[0])
+        with self.assertRaises(ValueError):
+            QueryProfile(Align(TEST_INPUT_FILE, "").align_params)
+        return
+
+    def test_seed_search(self):
+        """
+        Tests that the seed-and-extend search ranks the target holding the aligned sequence first, with its full
+        local alignment score
+        """
+        example_dir, _ = self.__testPaths__()
+        align = Align(os.path.join(example_dir, "alignment_example6.input"), "")
+        align_params = align.align_params
+        filler = "ACGTTGCAAGCTTACG" * 4
+        records = [("decoy", filler * 3), ("target", filler + align_params.seq_b + filler),
+                   ("reversed", align_params.seq_b[::-1])]
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "database.fasta")
+            with open(database, "w") as f:
+                for name, sequence in records:
+                    f.write(">{}\n{}\n{}\n".format(name, sequence[:80], sequence[80:]))
+            self.assertEqual(list(read_fasta(database)), records)
+            index = KmerIndex.from_fasta(database, align_params.alphabet_b, 8)
+            hits = SeedSearch(align_params, index).search(align_params.seq_a, top=2)
+            self.assertLessEqual(len(hits), 2)
+            score, name, _ = hits[0]
+            self.assertEqual(name, "target")
+            align_params.seq_b = records[1][1]
+            align_params.encode()
+            self.assertEqual(score, Align.from_params(align_params).find_best_score()[0])
+
+            output_file = os.path.join(directory, "hits.output")
+            write_hits(hits, output_file)
+            with open(output_file) as f:
+                self.assertEqual(f.read().split('\n')[:2], ["> target", str(round(score, 1))])
+        return
+
+    def test_seed_search_pruning(self):
+        """
+        Tests that targets whose best ungapped segment scores below min_ungapped aren't aligned with gaps, and that
+        the margin of the windows stops at max_window
+        """
+        example_dir, _ = self.__testPaths__()
+        align_params = Align(os.path.join(example_dir, "alignment_example6.input"), "").align_params
+        rng = random.Random(0)
+        names = ["random{}".format(i) for i in range(30)] + ["target"]
+        sequences = [''.join(rng.choice(align_params.alphabet_b) for _ in range(300)) for _ in range(30)]
+        sequences.append("ACGT" * 10 + align_params.seq_b + "TGCA" * 10)
+        index = KmerIndex(names, sequences, align_params.alphabet_b, 5)
+        results = []
+        for min_ungapped in [0.0, 60.0]:
+            search = SeedSearch(align_params, index, min_ungapped=min_ungapped)
+            search.__extendGapped__ = mock.Mock(wraps=search.__extendGapped__)
+            results.append((search.search(align_params.seq_a, top=1), search.__extendGapped__.call_count))
+        (unpruned, unpruned_count), (pruned, pruned_count) = results
+        # the random targets all share seeds with the query, but their segments score at most about 50
+        self.assertEqual(unpruned_count, len(names))
+        self.assertEqual(pruned_count, 1)
+        self.assertEqual([hit[:2] for hit in pruned], [hit[:2] for hit in unpruned])
+        self.assertEqual(pruned[0][1], "target")
+
+        search = SeedSearch(align_params, index, window=2, max_window=8, min_ungapped=60.0)
+        search.__windowAlign__ = mock.Mock(wraps=search.__windowAlign__)
+        search.search(align_params.seq_a, top=1)
+        # without the cap, the margin would double once more to 16
+        self.assertEqual([call.args[3] for call in search.__windowAlign__.call_args_list], [2, 4, 8])
+        return
+
+    def test_alignment_cache(self):
+        """
+        Tests that cached alignments are returned without populating any matrix, from memory and from disk, and
+        that both tiers evict their least recently used results
+        """
+        example_dir, _ = self.__testPaths__()
+        input_paths = [os.path.join(example_dir, name) for name in ["alignment_example2.input",
+                                                                    "alignment_example3.input"]]
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, "cache.sqlite")
+            output_path = os.path.join(directory, "cached.output")
+            cache = AlignmentCache(database)
+            first = Align(input_paths[0], output_path)
+            first.align(cache=cache)
+            second = Align(input_paths[0], output_path)
+            second.align(cache=cache)
+            self.assertIsNone(second.m_matrix)
+            self.assertEqual(first.alignment_result, second.alignment_result)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            # other options are other results
+            Align(input_paths[0], output_path).align(max_alignments=1, cache=cache)
+            self.assertEqual(cache.misses, 2)
+            cache.close()
+
+            # a new cache reads the disk tier, and keeps a single result in memory (the results take 33 and 355 bytes)
+            cache = AlignmentCache(database, memory_bytes=360)
+            third = Align(input_paths[0], output_path)
+            third.align(cache=cache)
+            self.assertIsNone(third.m_matrix)
+            self.assertEqual(first.alignment_result, third.alignment_result)
+            fourth = Align(input_paths[1], output_path)
+            fourth.align(cache=cache)
+            self.assertEqual(list(cache.memory.values()), [(fourth.alignment_result, 355)])
+            self.assertEqual(cache.memory_size, 355)
+            cache.close()
+
+            # a disk tier holding a single result keeps the latest one
+            latest = Align(input_paths[1], output_path)
+            latest.align(max_alignments=2)
+            cache = AlignmentCache(database, memory_bytes=0, disk_bytes=len(latest.alignment_result.encode()))
+            Align(input_paths[1], output_path).align(max_alignments=2, cache=cache)
+            self.assertEqual(cache.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0], 1)
+            self.assertEqual(len(cache.memory), 0)
+            cache.close()
+        return
+
+    def test_benchmark(self):
+        """
+        Tests the benchmark suite on short sequences, and that comparing results flags slower phases
+        """
+        seq_a, seq_b = generate_pair(50, 'mutated', random.Random(0))
+        self.assertEqual(len(seq_a), 50)
+        self.assertNotEqual(seq_a, seq_b)
+        results = run_suite([20], ['global', 'local'], ['random', 'mutated'], max_cells=300)
+        self.assertEqual(len(results['cases']), 4)
+        for case in results['cases']:
+            self.assertEqual(case['engine'], 'full' if case['cells'] <= 300 else 'linear')
+            self.assertGreater(case['peak_bytes'], 0)
+            self.assertIsNotNone(case['phases']['fill'])
+        self.assertEqual(compare(results, results), [])
+        slower = json.loads(json.dumps(results))
+        slower['cases'][0]['phases']['fill'] += 1
+        slower['cases'][0]['total'] += 1
+        self.assertEqual(len(compare(results, slower)), 2)
+        return
+
+    def test_align_profile(self):
+        """
+        Tests that align() profiles its phases on request, and appends the profile to a log file
+        """
+        example_dir, _ = self.__testPaths__()
+        input_path = os.path.join(example_dir, "alignment_example3.input")
+        self.assertIsNone(Align(input_path, "").align())
+        with tempfile.TemporaryDirectory() as directory:
+            align = Align(input_path, os.path.join(directory, "profiled.output"))
+            profile = align.align(profile=True)
+            self.assertEqual(list(profile.phases), ['load', 'fill', 'traceback_start', 'traceback', 'write'])
+            self.assertEqual(profile.cells, align.nrow * align.ncol)
+            self.assertEqual(profile.paths, 9)
+            self.assertEqual(profile.matrix_bytes, 3 * 9 * align.nrow * align.ncol)
+            self.assertEqual(profile.to_dict()['phases']['fill']['cells'], profile.cells)
+            phases = profile.to_dict()['phases']
+            self.assertEqual(phases['load']['cells'], 0)
+            # local alignment, the traceback can start anywhere
+            self.assertEqual(phases['traceback_start']['cells'], profile.cells)
+            self.assertGreater(phases['traceback']['cells'], 0)
+            self.assertEqual(phases['fill']['matrix_bytes'], profile.matrix_bytes)
+
+            # a cached result computes no entries
+            cache = AlignmentCache(os.path.join(directory, "cache.sqlite"))
+            Align(input_path, "").align(cache=cache)
+            cached = Align(input_path, "").align(cache=cache, profile=True)
+            cache.close()
+            self.assertEqual(list(cached.phases), ['load', 'write'])
+            self.assertEqual(cached.cells, 0)
+
+            log_file = os.path.join(directory, "profile.jsonl")
+            for band in [None, 2]:
+                Align(input_path, "").align(band=band, profile=log_file)
+            with open(log_file) as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(len(lines), 2)
+            self.assertLess(lines[1]['cells'], lines[0]['cells'])
+        return
+
     def test_score_matrix_print(self):
         score_matrix = ScoreMatrix('test', 4, 5)
         score_matrix.set_score(1, 2, 10)
@@ -92,6 +409,68 @@ class TestAlignmentClasses(unittest.TestCase):
         self.assertEqual(match_mat.get_score("C", "G"), -0.3)
         self.assertEqual(match_mat.get_score("G", "C"), 0)
 
+    def test_fasta_loading(self):
+        """
+        Tests loading the sequences from FASTA files, gzipped or not, with several records
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            fasta_a, fasta_b = os.path.join(directory, "a.fa.gz"), os.path.join(directory, "b.fa")
+            with gzip.open(fasta_a, "wt") as f:
+                f.write(">first\nTTTT\n>second sequence\nATG\nGCA\n\n")
+            with open(fasta_b, "w") as f:
+                f.write(">only\nAGG\nC\n")
+            self.assertEqual(list(read_fasta(fasta_a)), [("first", "TTTT"), ("second sequence", "ATGGCA")])
+            align_params = AlignmentParameters()
+            align_params.load_params_from_file(TEST_INPUT_FILE, (fasta_a, "second"), fasta_b)
+            self.assertEqual(align_params.seq_a, "ATGGCA")
+            self.assertEqual(align_params.seq_b, "AGGC")
+            self.assertEqual(align_params.dx, 0.1)
+            self.assertEqual(list(align_params.codes_a), [0, 1, 2, 2, 3, 0])
+            with self.assertRaises(ValueError):
+                align_params.load_params_from_file(TEST_INPUT_FILE, (fasta_a, "third"))
+
+            # align() loads the input file again, but reads the FASTA files only if they changed
+            with mock.patch('align.read_fasta_sequence', wraps=read_fasta_sequence) as reader:
+                output_path = os.path.join(directory, "fasta.output")
+                align = Align(TEST_INPUT_FILE, output_path, fasta_a=fasta_a, fasta_b=fasta_b)
+                align.align()
+                self.assertEqual(reader.call_count, 2)
+                with open(fasta_b, "w") as f:
+                    f.write(">only\nAGGCA\n")
+                align.align()
+                self.assertEqual(reader.call_count, 3)
+                self.assertEqual((align.align_params.seq_a, align.align_params.seq_b), ("TTTT", "AGGCA"))
+                self.assertEqual(list(align.align_params.codes_b), [0, 2, 2, 3, 0])
+        return
+
+
+    def test_param_encoding(self):
+        """
+        Tests the encoded sequences and dense match table built by "load_params_from_file()"
+        """
+        align_params = AlignmentParameters()
+        align_params.load_params_from_file(TEST_INPUT_FILE)
+        self.assertEqual(list(align_params.codes_a), [0, 0, 1, 2, 3])
+        self.assertEqual(list(align_params.codes_b), [0, 2, 2, 3])
+        self.assertEqual(align_params.score_table.shape, (4, 5))
+        for i, a in enumerate(align_params.alphabet_a):
+            for j, b in enumerate(align_params.alphabet_b):
+                self.assertEqual(align_params.score_table[i, j], align_params.match_matrix.get_score(a, b))
+
+        # letters outside of the alphabet are rejected when loading
+        with open(TEST_INPUT_FILE) as f:
+            lines = f.read().split('\n')
+        lines[1] = "AGZC"
+        bad_input = os.path.join(self.__testPaths__()[1], "bad_letter.input")
+        try:
+            with open(bad_input, "w") as f:
+                f.write('\n'.join(lines))
+            with self.assertRaises(ValueError):
+                AlignmentParameters().load_params_from_file(bad_input)
+        finally:
+            os.remove(bad_input)
+        with self.assertRaises(KeyError):
+            align_params.match_matrix.get_score("Z", "A")
 
     def test_update_ix(self):
         """
@@ -219,6 +598,173 @@ class TestAlignmentClasses(unittest.TestCase):
         self.assertEqual(traceback_start_local, (5, {(1, 1, 'M')}))
         return
 
+    def test_allocation_on_first_use(self):
+        """
+        Tests that the update methods and find_traceback_start allocate the matrices of a fresh Align
+        """
+        align = Align(TEST_INPUT_FILE, "")
+        align.update_m(1, 1)
+        self.assertEqual((align.m_matrix.nrow, align.m_matrix.ncol), (align.nrow, align.ncol))
+        align = Align(TEST_INPUT_FILE, "")
+        self.assertEqual(align.find_traceback_start()[0], 0)
+        return
+
+    def test_find_traceback_start_storages(self):
+        """
+        Tests that every storage finds the same best score and traceback starts
+        """
+        example_dir, _ = self.__testPaths__()
+        input_path = os.path.join(example_dir, "alignment_example3.input")
+        for global_alignment in [True, False]:
+            results = []
+            for storage, band in [('object', None), ('array', None), ('array', 100)]:
+                align = Align(input_path, "", storage=storage)
+                align.bandwidth = band
+                align.align_params.global_alignment = global_alignment
+                align.populate_score_matrices()
+                results.append(align.find_traceback_start())
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(results[0], results[2])
+        return
+
+    def test_bits_storage(self):
+        """
+        Tests that bits storage keeps the pointers of array storage and traces back the same alignments
+        """
+        aligns = [Align(TEST_INPUT_FILE, "", storage=storage) for storage in ['array', 'bits']]
+        for align in aligns:
+            align.populate_score_matrices()
+        for name in ['m_matrix', 'ix_matrix', 'iy_matrix']:
+            array_matrix, bits_matrix = getattr(aligns[0], name), getattr(aligns[1], name)
+            for row in range(array_matrix.nrow):
+                for col in range(array_matrix.ncol):
+                    self.assertEqual(array_matrix.get_pointers(row, col), bits_matrix.get_pointers(row, col))
+            self.assertLess(bits_matrix.memory_bytes(), array_matrix.memory_bytes())
+        with self.assertRaises(ValueError):
+            aligns[1].m_matrix.get_score(1, 1)
+        example_dir, _ = self.__testPaths__()
+        for example in ["alignment_example1.input", "alignment_example3.input"]:
+            input_path = os.path.join(example_dir, example)
+            for global_alignment in [True, False]:
+                results = []
+                for storage in ['array', 'bits']:
+                    align = Align(input_path, "", storage=storage)
+                    align.align_params.global_alignment = global_alignment
+                    align.populate_score_matrices()
+                    score, start_points = align.find_traceback_start()
+                    results.append((score, start_points, list(align.iter_tracebacks(start_points, 20))))
+                self.assertEqual(results[0], results[1])
+        # every entry ties the best score of 0, then a better score drops the ties
+        for seq_b in ["C" * 30, "C" * 30 + "A"]:
+            results = []
+            for storage in ['array', 'bits']:
+                align = Align(TEST_INPUT_FILE, "", storage=storage)
+                align.align_params.seq_a, align.align_params.seq_b = "A" * 20, seq_b
+                align.align_params.encode()
+                align.align_params.global_alignment = False
+                align.nrow, align.ncol = 21, len(seq_b) + 1
+                align.populate_score_matrices()
+                results.append(align.find_traceback_start())
+            self.assertEqual(results[0], results[1])
+        return
+
+    def test_extend_b(self):
+        """
+        Tests that extending seq_b of populated matrices gives the same alignment as aligning from scratch
+        """
+        example_dir, _ = self.__testPaths__()
+        input_path = os.path.join(example_dir, "alignment_example3.input")
+        for storage in ['object', 'array']:
+            for global_alignment in [True, False]:
+                results = []
+                for split in [None, 5]:
+                    align = Align(input_path, "", storage=storage)
+                    align.align_params.global_alignment = global_alignment
+                    seq_b = align.align_params.seq_b
+                    if split is not None:
+                        align.align_params.seq_b = seq_b[:split]
+                        align.ncol = split + 1
+                    align.populate_score_matrices()
+                    if split is not None:
+                        align.extend_b(seq_b[split:split + 1])
+                        align.extend_b(seq_b[split + 1:])
+                    score, start_points = align.find_traceback_start()
+                    results.append((score, start_points, list(align.iter_tracebacks(start_points, 20))))
+                self.assertEqual(results[0], results[1])
+        align = Align(input_path, "", storage='bits')
+        align.populate_score_matrices()
+        with self.assertRaises(ValueError):
+            align.extend_b("A")
+
+        # align() loads the input file again, write_alignments keeps the extended sequence
+        input_path = os.path.join(example_dir, "alignment_example5.input")
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "extended.output")
+            fresh = Align(input_path, output_path)
+            fresh.align()
+            align = Align(input_path, output_path)
+            align.populate_score_matrices()
+            align.extend_b("G" * 12)
+            align.write_alignments()
+            extended = Align(input_path, "")
+            extended.extend_b("G" * 12)
+            extended.populate_score_matrices()
+            score, start_points = extended.find_traceback_start()
+            self.assertEqual(align.alignment_result, extended.format_result(
+                score, [extended.__printOutput__(trace) for trace in extended.iter_tracebacks(start_points)]))
+            align.align()
+            self.assertEqual(align.alignment_result, fresh.alignment_result)
+
+        # appending columns one at a time costs less than filling the extended matrices again
+        rng = random.Random(0)
+        for global_alignment in [True, False]:
+            seq_a, seq_b = generate_pair(1000, 'random', rng)[0], generate_pair(400, 'random', rng)[0]
+            align = Align(input_path, "")
+            align.align_params.seq_a, align.align_params.seq_b = seq_a, seq_b[:350]
+            align.align_params.global_alignment = global_alignment
+            align.align_params.encode()
+            align.nrow, align.ncol = len(seq_a) + 1, 351
+            align.populate_score_matrices()
+            start = time.perf_counter()
+            for letter in seq_b[350:]:
+                align.extend_b(letter)
+            extend_seconds = time.perf_counter() - start
+            full = Align.from_params(align.align_params)
+            start = time.perf_counter()
+            full.populate_score_matrices()
+            self.assertLess(extend_seconds, time.perf_counter() - start)
+            for name in ['m_matrix', 'ix_matrix', 'iy_matrix']:
+                self.assertTrue(np.array_equal(getattr(align, name).scores, getattr(full, name).scores))
+        return
+
+
+    def test_top_local_alignments(self):
+        """
+        Tests that suboptimal local alignments come from best to worst without sharing entries, and that filling
+        again only the affected columns gives the same matrices as filling everything with the mask
+        """
+        example_dir, _ = self.__testPaths__()
+        input_path = os.path.join(example_dir, "alignment_example5.input")
+        align = Align(input_path, "")
+        hits = align.top_local_alignments(4)
+        with open(os.path.join(example_dir, "alignment_example5.output")) as f:
+            self.assertEqual(round(hits[0][0], 1), float(f.readline()))
+        scores = [score for score, _ in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        entries = [(row, col) for _, trace in hits for row, col, _ in trace]
+        self.assertEqual(len(entries), len(set(entries)))
+        masked_align = Align(input_path, "")
+        masked_align.masked = align.masked.copy()
+        masked_align.populate_score_matrices()
+        for col in range(1, masked_align.ncol):
+            masked_align.__fillColumn__(col)
+        for name in ['m_matrix', 'ix_matrix', 'iy_matrix']:
+            matrix, masked_matrix = getattr(align, name), getattr(masked_align, name)
+            self.assertTrue(np.array_equal(matrix.scores, masked_matrix.scores))
+            self.assertTrue(np.array_equal(matrix.pointer_flags, masked_matrix.pointer_flags))
+        with self.assertRaises(ValueError):
+            Align(os.path.join(example_dir, "alignment_example1.input"), "").top_local_alignments(2)
+        return
 
     def test_traceback(self):
         '''
@@ -231,6 +777,34 @@ class TestAlignmentClasses(unittest.TestCase):
             print(align.visualizePaths(trace))
         return
 
+    def test_iter_tracebacks(self):
+        '''
+        Test lazy traceback enumeration, with a cap and on paths longer than the recursion limit
+        '''
+        example_dir, _ = self.__testPaths__()
+        align = Align(os.path.join(example_dir, 'alignment_example3.input'), "")
+        align.populate_score_matrices()
+        score, start_points = align.find_traceback_start()
+        traces = list(align.iter_tracebacks(start_points))
+        self.assertEqual(len(traces), 9)
+        self.assertEqual(len(set(tuple(trace) for trace in traces)), 9)
+        self.assertEqual(list(align.iter_tracebacks(start_points, max_alignments=2)), traces[:2])
+
+        # a single path of 1500 columns
+        align = Align("", "")
+        align.align_params = AlignmentParameters()
+        align.align_params.seq_a, align.align_params.seq_b = "A" * 1500, "A" * 1500
+        align.align_params.match_matrix.set_score("A", "A", 1)
+        align.align_params.global_alignment = True
+        align.nrow, align.ncol = 1501, 1501
+        align.populate_score_matrices()
+        score, start_points = align.find_traceback_start()
+        self.assertEqual(score, 1500)
+        traces = list(align.iter_tracebacks(start_points))
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(align.__printOutput__(traces[0]), "A" * 1500 + "\n" + "A" * 1500)
+        return
+
     def __testPaths__(self):
         # get project path
         file_path = os.path.dirname(os.path.abspath(__file__))
@@ -254,6 +828,25 @@ class TestAlignmentClasses(unittest.TestCase):
         self.assertTrue(compare_alignments(output_path, solution_path))
         return
 
+    def test_stream_output(self):
+        """
+        Tests that streaming the alignments writes the same output file as writing them at the end
+        """
+        example_dir, _ = self.__testPaths__()
+        with tempfile.TemporaryDirectory() as output_dir:
+            for example in ["alignment_example1.input", "alignment_example4.input", "alignment_example6.input"]:
+                input_path = os.path.join(example_dir, example)
+                output_path = os.path.join(output_dir, "full.output")
+                stream_path = os.path.join(output_dir, "stream.output")
+                Align(input_path, output_path).align(max_alignments=50)
+                align = Align(input_path, stream_path)
+                profile = align.align(max_alignments=50, stream=True, profile=True)
+                self.assertIsNone(align.alignment_result)
+                with open(output_path) as f, open(stream_path) as g:
+                    self.assertEqual(f.read(), g.read())
+                self.assertEqual(profile.paths, len(read_seq_pairs(stream_path)))
+        return
+
     def __diffAlign__(self, align_a: List[List[str]], align_b: List[List[str]]):
         '''
         Find the part of alignments that only appear in one of the alignments
@@ -285,5 +878,148 @@ class TestAlignmentClasses(unittest.TestCase):
                 test_success = False
         self.assertTrue(test_success)
 
+    def test_linear_space(self):
+        """
+        Tests that the linear space mode finds one of the optimal alignments, also when dividing down to tiny blocks
+        """
+        example_dir, _ = self.__testPaths__()
+        for block_size in [LINEAR_BLOCK_SIZE, 4]:
+            for example in sorted(os.listdir(example_dir)):
+                if not example.endswith('.input'):
+                    continue
+                input_path = os.path.join(example_dir, example)
+                solution_path = os.path.join(example_dir, example.replace('.input', '.output'))
+                with open(solution_path) as f:
+                    solution_score = float(f.readline())
+                solution_pairs = ["%s %s" % (pair[0], pair[1]) for pair in read_seq_pairs(solution_path)]
+                align = Align(input_path, "")
+                with mock.patch('align.LINEAR_BLOCK_SIZE', block_size):
+                    score, trace = align.linear_space_alignment()
+                self.assertEqual(round(score, 1), solution_score)
+                self.assertIn(align.__printOutput__(trace).replace('\n', ' '), solution_pairs)
+                self.assertIsNone(align.m_matrix)
+
+    def test_batch(self):
+        """
+        Tests that the batch runner writes the same alignments as the examples
+        """
+        example_dir, _ = self.__testPaths__()
+        input_files = collect_inputs([example_dir])
+        self.assertEqual(len(input_files), 9)
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = run_batch(input_files, output_dir, workers=2)
+            self.assertEqual(len(results), 9)
+            for input_file, output_file, seconds, error in results:
+                self.assertIsNone(error)
+                self.assertTrue(compare_alignments(output_file, input_file.replace('.input', '.output')))
+
+    def test_all_vs_all(self):
+        """
+        Tests that the all-vs-all engine gives the score of each pair, and resumes from a checkpoint
+        """
+        example_dir, _ = self.__testPaths__()
+        align_params = AlignmentParameters()
+        align_params.load_params_from_file(os.path.join(example_dir, "alignment_example1.input"))
+        rng = random.Random(0)
+        sequences = [generate_pair(rng.randint(10, 30), 'mutated', rng)[1] for _ in range(9)]
+        scores = all_vs_all(sequences, align_params, block_size=4, workers=2)
+        self.assertTrue(np.array_equal(scores, scores.T))
+        for i, j in [(0, 0), (1, 7), (5, 6)]:
+            pair_params = AlignmentParameters()
+            pair_params.load_params_from_file(os.path.join(example_dir, "alignment_example1.input"))
+            pair_params.seq_a, pair_params.seq_b = sequences[i], sequences[j]
+            pair_params.encode()
+            align = Align.from_params(pair_params)
+            align.populate_score_matrices()
+            self.assertEqual(scores[i, j], align.find_traceback_start()[0])
+        distances = score_distances(scores)
+        self.assertTrue(np.all(np.diag(distances) == 0))
+        self.assertTrue(np.all((distances >= 0) & (distances <= 1)))
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "scores.npy")
+            all_vs_all(sequences, align_params, block_size=4, workers=2, checkpoint=checkpoint)
+            # a missing block is scored again, a completed one (marked here) is kept as is
+            saved = np.load(checkpoint, mmap_mode='r+')
+            saved[0:4, 4:8] = np.nan
+            saved[8, 8] = -1
+            saved.flush()
+            del saved
+            resumed = all_vs_all(sequences, align_params, block_size=4, workers=2, checkpoint=checkpoint)
+            self.assertEqual(resumed[8, 8], -1)
+            resumed[8, 8] = scores[8, 8]
+            self.assertTrue(np.array_equal(scores, resumed))
+            # other sequences or parameters don't reuse the checkpoint
+            others = sequences[1:] + sequences[:1]
+            self.assertTrue(np.array_equal(all_vs_all(others, align_params, block_size=4, workers=2,
+                                                      checkpoint=checkpoint),
+                                           all_vs_all(others, align_params, block_size=4, workers=2)))
+            align_params.dx += 1
+            changed = all_vs_all(others, align_params, block_size=4, workers=2, checkpoint=checkpoint)
+            self.assertTrue(np.array_equal(changed, all_vs_all(others, align_params, block_size=4, workers=2)))
+        return
+
+    def test_multiple_alignment(self):
+        """
+        Tests the guide trees, and that the progressive alignment keeps every sequence with no all-gap column
+        """
+        distances = np.array([[0, 5, 9, 9, 8], [5, 0, 10, 10, 9], [9, 10, 0, 8, 7], [9, 10, 8, 0, 3],
+                              [8, 9, 7, 3, 0]], dtype=float)
+        self.assertEqual(upgma(distances), [(3, 4), (0, 1), (2, 5), (6, 7)])
+        self.assertEqual(neighbor_joining(distances), [(0, 1), (5, 2), (6, 3), (7, 4)])
+        example_dir, _ = self.__testPaths__()
+        align_params = AlignmentParameters()
+        align_params.load_params_from_file(os.path.join(example_dir, "alignment_example1.input"))
+        rng = random.Random(0)
+        root, _ = generate_pair(40, 'random', rng)
+        sequences = [generate_pair(0, 'random', rng)[0] + root[rng.randint(0, 5):] for _ in range(3)] + \
+                    [generate_pair(len(root), 'mutated', random.Random(seed))[1] for seed in range(4)]
+        for tree in ['upgma', 'nj']:
+            rows = multiple_alignment(sequences, align_params, tree, workers=2)
+            self.assertEqual(len({len(row) for row in rows}), 1)
+            self.assertEqual([row.replace('_', '') for row in rows], sequences)
+            self.assertFalse(any(all(row[k] == '_' for row in rows) for k in range(len(rows[0]))))
+        # the guide tree of another family doesn't come from the checkpoint of the first one
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "scores.npy")
+            multiple_alignment(sequences, align_params, workers=2, checkpoint=checkpoint)
+            others = [generate_pair(len(root), 'random', random.Random(seed))[1] for seed in range(len(sequences))]
+            self.assertEqual(multiple_alignment(others, align_params, workers=2, checkpoint=checkpoint),
+                             multiple_alignment(others, align_params, workers=2))
+        # two single sequences are aligned as by Align, with the unaligned ends gapped
+        align = Align(os.path.join(example_dir, "alignment_example1.input"), "")
+        align.populate_score_matrices()
+        score, start_points = align.find_traceback_start()
+        pair = align.__printOutput__(next(align.iter_tracebacks(start_points, 1))).split('\n')
+        rows = align_profiles(align_params, [align_params.seq_a], [align_params.seq_b])
+        self.assertTrue(all(part in row for part, row in zip(pair, rows)))
+        return
+
+    def test_sweep(self):
+        """
+        Tests that a gap penalty sweep gives the scores and alignments of aligning with each setting
+        """
+        example_dir, _ = self.__testPaths__()
+        input_path = os.path.join(example_dir, "alignment_example3.input")
+        align_params = AlignmentParameters()
+        align_params.load_params_from_file(input_path)
+        grid = gap_grid(align_params, dx=[0.7, 1.5], ey=[0.4, 1])
+        self.assertEqual(len(grid), 4)
+        self.assertIn((0.7, 0.5, 0.7, 0.4), grid)
+        scores = run_sweep(align_params, grid, workers=2)
+        outputs = run_sweep(align_params, grid, workers=2, max_alignments=5)
+        for (gaps, score, output), (_, full_score, full_output) in zip(scores, outputs):
+            self.assertIsNone(output)
+            setting_params = AlignmentParameters()
+            setting_params.load_params_from_file(input_path)
+            setting_params.dx, setting_params.ex, setting_params.dy, setting_params.ey = gaps
+            setting_params.encode()
+            align = Align.from_params(setting_params)
+            align.align(max_alignments=5)
+            self.assertEqual(score, full_score)
+            self.assertEqual(full_output, align.alignment_result)
+            if gaps == (0.7, 0.5, 0.7, 0.4):
+                with open(os.path.join(example_dir, "alignment_example3.output")) as f:
+                    self.assertEqual(round(score, 1), float(f.readline()))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
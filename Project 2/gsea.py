@@ -8,7 +8,11 @@ import os
 import sys
 import pandas as pd
 import numpy as np
-from typing import List, Union
+from scipy import sparse
+from typing import List, Tuple, Union
+
+# number of (gene set, permutation, gene) entries of the running sums scored at once by get_null_enrichment_scores
+BLOCK_ENTRIES = 1 << 22
 
 
 class GSEA:
@@ -19,6 +23,13 @@ class GSEA:
         self.expfile = None
         self.sampfile = None
         self.genesets = None
+        # gene name -> row in expfile, gene set name -> row in membership
+        self.gene_index = None
+        self.geneset_index = None
+        # sparse gene sets x genes matrix, genes of the sets that are not in expfile left out
+        self.membership = None
+        # (expfile, sampfile, gene indices ranked by logFC) of the last observed ranking
+        self.rank_cache = None
 
     def load_data(self, expfile: str, sampfile: str, genesets: str) -> None:
         """
@@ -40,8 +51,24 @@ class GSEA:
             content = file.read()
         # format geneset as list of list, throw empty lines
         self.genesets = [line.split('\t') for line in content.split('\n') if line != '']
+        self.__indexGeneSets__()
         return
 
+    def __indexGeneSets__(self) -> None:
+        """
+        build the gene and gene set indices and the membership matrix of the loaded data, and reset the ranking
+        """
+        self.gene_index = {gene: row for row, gene in enumerate(self.expfile.index)}
+        self.geneset_index = {geneset[0]: row for row, geneset in enumerate(self.genesets)}
+        rows, cols = [], []
+        for row, geneset in enumerate(self.genesets):
+            genes = {self.gene_index[gene] for gene in geneset[2:] if gene in self.gene_index}
+            rows += [row] * len(genes)
+            cols += sorted(genes)
+        self.membership = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                            shape=(len(self.genesets), len(self.gene_index)))
+        self.rank_cache = None
+
     def get_gene_rank_order(self, permute: bool = False) -> List[str]:
         """
         return a list of all genes (as strings) ranked by their logFC between patient and control,
@@ -49,7 +76,33 @@ class GSEA:
         :param permute: boolean value, "true" used in calculating p-value
         :return: list of all gene ranked by logFC = log(P) - log(C)
         """
-        # get index of positive and negative cases (optional permutation)
+        return list(self.expfile.index[self.__rankIndices__(permute=permute)])
+
+    def __rankIndices__(self, permute: bool = False) -> np.ndarray:
+        """
+        return the rows of expfile ranked by logFC, the observed ranking being computed once per loaded data
+        :param permute: boolean value, "true" used in calculating p-value
+        :return: gene indices, highest logFC first
+        """
+        if not permute and self.rank_cache is not None and \
+                self.rank_cache[0] is self.expfile and self.rank_cache[1] is self.sampfile:
+            return self.rank_cache[2]
+        pos_index, neg_index = self.__splitSamples__(permute=permute)
+        # get mean of pos and neg classes
+        pos_mean = np.mean(self.expfile.loc[:, pos_index], axis=1)
+        neg_mean = np.mean(self.expfile.loc[:, neg_index], axis=1)
+        # rank the gene (NOTE: it should be largest logFC first, so sort by negative value)
+        ranked = np.asarray((-(pos_mean - neg_mean)).argsort())
+        if not permute:
+            self.rank_cache = (self.expfile, self.sampfile, ranked)
+        return ranked
+
+    def __splitSamples__(self, permute: bool = False) -> Tuple[List[str], List[str]]:
+        """
+        return the positive and negative cases (optional permutation)
+        :param permute: boolean value, "true" used in calculating p-value
+        :return: names of the positive samples, names of the negative samples
+        """
         if not permute:
             pos_index = list(self.sampfile[self.sampfile[1] == 1][0])
             neg_index = list(self.sampfile[self.sampfile[1] == 0][0])
@@ -58,11 +111,7 @@ class GSEA:
             num_pos = np.sum(self.sampfile[1] == 1)
             pos_index = index[:int(0.5 * num_pos)]
             neg_index = index[int(0.5 * num_pos):]
-        # get mean of pos and neg classes
-        pos_mean = np.mean(self.expfile.loc[:, pos_index], axis=1)
-        neg_mean = np.mean(self.expfile.loc[:, neg_index], axis=1)
-        # rank the gene (NOTE: it should be largest logFC first, so sort by negative value)
-        return list(self.expfile.index[(-(pos_mean - neg_mean)).argsort()])
+        return pos_index, neg_index
 
     def get_enrichment_score(self, geneset: str, permute=False) -> float:
         """
@@ -73,30 +122,36 @@ class GSEA:
         :param geneset: name of gene set of interest
         :return: the enrichment score, a float correct to two decimal places
         """
-        # ranked gene list
-        gene_list = self.get_gene_rank_order(permute=permute)
-        # 1. calculate up and down score (step size)
-        # get the genes in gene set (filtered to be in our files)
-        genes = [gene for gene in self.__getGeneSet__(geneset) if gene in self.expfile.index]
-        # num of total genes
-        nt = self.expfile.shape[0]
-        # num of genes in gene set
-        ng = len(genes)
+        return round(self.get_enrichment_scores([geneset], permute=permute)[0], 2)
+
+    def get_enrichment_scores(self, genesets: List[str], permute: bool = False) -> np.ndarray:
+        """
+        return the enrichment scores (not rounded) of several gene sets against the same ranked gene list
+        :param genesets: names of gene sets of interest
+        :param permute: boolean value, "true" used in calculating p-value
+        :return: enrichment score of each gene set
+        """
+        # membership of the genes in each gene set (filtered to be in our files), in rank order
+        rows = [self.geneset_index[geneset] for geneset in genesets]
+        ranked = self.__rankIndices__(permute=permute)
+        return self.__runningSumMax__(self.membership[rows][:, ranked].toarray())
+
+    @staticmethod
+    def __runningSumMax__(membership: np.ndarray) -> np.ndarray:
+        """
+        return the supremum of the running sum (brownian bridge) of each gene set
+        :param membership: boolean array, gene sets (x permutations) x genes in rank order
+        :return: supremum score of each gene set (and permutation), not taking absolute, the start 0 included
+        """
+        # 1. calculate up and down score (step size) from num of total genes and num of genes in each gene set
+        nt = membership.shape[-1]
+        ng = membership.sum(axis=-1)
         up_score = np.sqrt((nt - ng) / ng)
         down_score = - np.sqrt(ng / (nt - ng))
-        # 2. moving down the ranked list of genes.
-        bb_score = [0]
-        current_score = 0
-        for gene in gene_list:
-            # if target gene, add score
-            if gene in genes:
-                current_score += up_score
-            # if no, subtract score
-            else:
-                current_score += down_score
-            bb_score.append(current_score)
-        # 3. find supremum score (not taking absolute) (round to two decimal place)
-        return round(max(bb_score), 2)
+        # 2. moving down the ranked list of genes: add up score for target genes, subtract down score otherwise
+        bb_score = np.cumsum(np.where(membership, up_score[..., None], down_score[..., None]), axis=-1)
+        # 3. find supremum score
+        return np.maximum(bb_score.max(axis=-1), 0)
 
     def __getGeneSet__(self, geneset: str) -> Union[List[str], None]:
         """
@@ -105,13 +160,43 @@ class GSEA:
         :return: list of names of genes
         """
         try:
-            gene_set_names = [gs[0] for gs in self.genesets]
-            index = gene_set_names.index(geneset)
-            return self.genesets[index][2:]
-        except ValueError:
+            return self.genesets[self.geneset_index[geneset]][2:]
+        except KeyError:
             print('Can\'t find specified gene set.')
             return
 
+    def get_null_enrichment_scores(self, genesets: List[str], permutation_num: int = 100,
+                                   block_size: int = None) -> np.ndarray:
+        """
+        return the enrichment scores (not rounded) of several gene sets under the same label permutations.
+        The logFC of every permutation comes from one product of the expression matrix with a matrix of the class
+        weights of the samples, and the gene sets are scored against blocks of permuted rankings at once.
+        :param genesets: names of gene sets of interest
+        :param permutation_num: number of label permutations
+        :param block_size: number of permutations scored at once (by default, about BLOCK_ENTRIES entries per block)
+        :return: enrichment scores, gene sets x permutations
+        """
+        samples = list(self.sampfile[0])
+        column = {sample: col for col, sample in enumerate(samples)}
+        # logFC = mean(P) - mean(C), as a weight of each sample for each permutation
+        assignment = np.zeros((len(samples), permutation_num))
+        for perm in range(permutation_num):
+            pos_index, neg_index = self.__splitSamples__(permute=True)
+            assignment[[column[sample] for sample in pos_index], perm] = 1 / len(pos_index)
+            assignment[[column[sample] for sample in neg_index], perm] = -1 / len(neg_index)
+        logfc = self.expfile.loc[:, samples].to_numpy() @ assignment
+        # rank the genes of each permutation, largest logFC first
+        ranked = np.argsort(-logfc, axis=0).T
+        membership = self.membership[[self.geneset_index[geneset] for geneset in genesets]].toarray()
+        if block_size is None:
+            block_size = max(1, BLOCK_ENTRIES // max(1, membership.size))
+        scores = np.zeros((len(genesets), permutation_num))
+        for start in range(0, permutation_num, block_size):
+            # gene sets x permutations of the block x genes in rank order
+            block = membership[:, ranked[start:start + block_size]]
+            scores[:, start:start + block_size] = self.__runningSumMax__(block)
+        return scores
+
     def getSignificance(self, geneset: str, permutation_num: int = 100) -> float:
         """
         Calculate p-value for a specific geneset
@@ -119,26 +204,22 @@ class GSEA:
         :return: p-value of significance
         """
         score = self.get_enrichment_score(geneset)
-        random_score = []
-        for i in range(permutation_num):
-            random_score.append(self.get_enrichment_score(geneset, permute=True))
-        pvalue = np.mean(np.array(random_score) > score)
+        random_score = np.round(self.get_null_enrichment_scores([geneset], permutation_num)[0], 2)
+        pvalue = np.mean(random_score > score)
         return pvalue
 
     def get_sig_sets(self, p: float, permutation_num: int = 100) -> List[str]:
         """
          return the list of significant gene sets (as strings),
          at a corrected threshold of p, by name.
+         All gene sets are scored against the same permutations.
         :param p: corrected threshold of p
         :return: list of significant gene sets
         """
         geneset_names = [i[0] for i in self.genesets]
-        pvalue = []
-        for geneset_name in geneset_names:
-            # print("working on set ", geneset_name)
-            p_for_set = self.getSignificance(geneset_name, permutation_num=permutation_num)
-            # print("for set {}, p is {}".format(geneset_name, p_for_set))
-            pvalue.append(p_for_set)
+        score = np.round(self.get_enrichment_scores(geneset_names), 2)
+        random_score = np.round(self.get_null_enrichment_scores(geneset_names, permutation_num), 2)
+        pvalue = np.mean(random_score > score[:, None], axis=1)
         return [geneset_names[i] for i in range(len(geneset_names)) if pvalue[i] < p]
 
 